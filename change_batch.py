@@ -0,0 +1,277 @@
+"""Run the change detector headless over recorded signals.
+
+A signal is a 1-D NumPy array with one input value per time step (dt). It
+can be given whole or in chunks, so signals that do not fit in memory can be
+streamed from disk (e.g. from ``np.load(..., mmap_mode='r')``). Both
+detectors return change events as times in seconds; the neural one also
+gives the sequence of letters its output went through.
+
+``ReferenceDetector`` computes what the neural model approximates (the
+difference between a fast and a slowly filtered copy of the input, passed
+through the threshold) with whole-array operations, to score the neural
+detector against.
+
+Usage::
+
+    python change_batch.py signal.npy --chunk 10000
+    python change_batch.py --random 100 --duration 5
+"""
+import argparse
+import concurrent.futures
+import functools
+import math
+
+import nengo
+import numpy as np
+
+import change_detector
+
+fast_synapse = 0.005  # nengo's default synapse, from the input to the detector
+slow_synapse = 0.05  # the delayed copy (see change_detector.build)
+change_threshold = 0.8
+
+
+def lowpass(x, tau, dt, y0=0.0):
+    """Filter x with a first-order lowpass (as a nengo synapse), from y0.
+
+    Done in blocks, each with a cumulative sum, so it stays vectorised
+    without the scaling factors overflowing.
+    """
+    a = math.exp(-dt / tau)
+    block = max(1, min(1024, int(math.log(1e6) / -math.log(a))))
+    powers = a ** np.arange(1, block + 1)
+    y = np.empty(len(x))
+    for start in range(0, len(x), block):
+        chunk = np.asarray(x[start:start + block], dtype=float)
+        p = powers[:len(chunk)]
+        y[start:start + block] = p * (y0 + (1 - a) * np.cumsum(chunk / p))
+        y0 = y[start + len(chunk) - 1]
+    return y
+
+
+class ReferenceDetector(object):
+    """Non-neural change detector, with state kept between chunks."""
+
+    def __init__(self, dt=0.001, threshold=change_threshold, refractory=0.1):
+        self.dt = dt
+        self.threshold = threshold
+        self.refractory = refractory
+        self.reset()
+
+    def reset(self):
+        self.fast = self.slow = 0.0
+        self.steps = 0
+        self.firing = False
+        self.events = []
+
+    def process(self, chunk):
+        """Add a chunk of the signal, returning the changes found in it."""
+        fast = lowpass(chunk, fast_synapse, self.dt, self.fast)
+        slow = lowpass(fast, slow_synapse, self.dt, self.slow)
+        self.fast, self.slow = fast[-1], slow[-1]
+        firing = np.abs(fast - slow) > self.threshold
+        starts = np.flatnonzero(firing & ~np.concatenate([[self.firing], firing[:-1]]))
+        self.firing = firing[-1]
+        new = []
+        for step in starts.tolist():
+            t = (self.steps + step + 1) * self.dt
+            if not self.events or t - self.events[-1] >= self.refractory:
+                self.events.append(t)
+                new.append(t)
+        self.steps += len(chunk)
+        return new
+
+
+class NeuralDetector(object):
+    """The change detector model, built once and fed chunks of a signal."""
+
+    def __init__(self, dt=0.001, seed=None, letter_threshold=0.5, **model_args):
+        # model_args (letters, transitions, dimensions, ...) are passed to
+        # change_detector.make_model
+        self.dt = dt
+        self.letter_threshold = letter_threshold
+        self.chunk = np.zeros(1)
+        self.offset = 0  # time step the current chunk starts at
+        self.firing = False
+        self.letter = None
+        self.events = []
+        self.letters = []
+
+        def play(t):
+            step = int(round(t / dt)) - 1 - self.offset
+            return self.chunk[min(step, len(self.chunk) - 1)]
+
+        model = change_detector.make_model(seed=seed, input_=play, **model_args)
+        letters = model.letterVocab
+        self.letter_names = letters.keys
+        self.letter_vectors = np.array([letters[key].v for key in letters.keys])
+
+        def observe_change(t, x):
+            firing = x[0] > 0.5
+            if firing and not self.firing:
+                if not self.events or t - self.events[-1] >= 0.1:
+                    self.events.append(t)
+            self.firing = firing
+
+        def observe_letter(t, x):
+            similarity = np.dot(self.letter_vectors, x)
+            best = int(np.argmax(similarity))
+            if similarity[best] > self.letter_threshold and best != self.letter:
+                self.letter = best
+                self.letters.append(self.letter_names[best])
+
+        with model:
+            nengo.Connection(model.change_output,
+                             nengo.Node(observe_change, size_in=1, size_out=0), synapse=0.01)
+            nengo.Connection(model.output.output,
+                             nengo.Node(observe_letter, size_in=letters.dimensions, size_out=0),
+                             synapse=0.01)
+        self.model = model
+        self.sim = nengo.Simulator(model, dt=dt, progress_bar=False)
+        self.reset()
+
+    def reset(self):
+        self.sim.reset()
+        self.offset = 0
+        self.firing = False
+        self.letter = None
+        self.events = []
+        self.letters = []
+
+    def process(self, chunk):
+        """Run the model over a chunk of the signal, returning the changes
+        found in it."""
+        before = len(self.events)
+        self.chunk = np.asarray(chunk, dtype=float)
+        self.sim.run_steps(len(self.chunk))
+        self.offset += len(self.chunk)
+        return self.events[before:]
+
+    def close(self):
+        self.sim.close()
+
+
+def chunks(signal, size=None):
+    if size is None:
+        yield signal
+    else:
+        for start in range(0, len(signal), size):
+            yield signal[start:start + size]
+
+
+def run(detector, signal, chunk_size=None):
+    """(events, letters) of a detector over a signal, given whole or as an
+    iterable of chunks."""
+    detector.reset()
+    if isinstance(signal, np.ndarray):
+        signal = chunks(signal, chunk_size)
+    for chunk in signal:
+        detector.process(chunk)
+    return list(detector.events), list(getattr(detector, 'letters', []))
+
+
+def score(events, reference, tolerance=0.1):
+    """How well events match the reference events: each reference event can
+    be matched by one event at most tolerance seconds after it."""
+    events = np.asarray(events)
+    matched = 0
+    latency = []
+    used = np.zeros(len(events), dtype=bool)
+    for t in reference:
+        candidates = np.flatnonzero(~used & (events >= t - 0.01) & (events <= t + tolerance))
+        if len(candidates):
+            used[candidates[0]] = True
+            matched += 1
+            latency.append(events[candidates[0]] - t)
+    precision = matched / len(events) if len(events) else 1.0
+    recall = matched / len(reference) if len(reference) else 1.0
+    return {
+        'precision': precision,
+        'recall': recall,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'latency': float(np.mean(latency)) if latency else float('nan'),
+    }
+
+
+def letters_in_order(letters, transitions):
+    """Fraction of the letter steps that follow one of the transitions."""
+    if len(letters) < 2:
+        return 1.0
+    allowed = set(transitions)
+    return float(np.mean([step in allowed for step in zip(letters, letters[1:])]))
+
+
+def random_signal(duration, dt=0.001, changes=10, seed=None, noise=0.02):
+    """A piecewise constant signal in [-1, 1] that jumps by at least 1 at
+    random times, plus noise."""
+    rng = np.random.RandomState(seed)
+    steps = int(round(duration / dt))
+    times = np.sort(rng.choice(np.arange(1, steps), size=min(changes, steps - 1),
+                               replace=False))
+    levels = rng.uniform(0.5, 1.0, size=len(times) + 1) * (-1) ** np.arange(len(times) + 1)
+    signal = levels[np.searchsorted(times, np.arange(steps), side='right')]
+    return signal + rng.normal(0, noise, size=steps)
+
+
+_detectors = {}
+
+
+def _score_signal(seed, duration, dt, changes, model_seed):
+    # one random signal, in a worker process that keeps its detector
+    key = (dt, model_seed)
+    if key not in _detectors:
+        _detectors[key] = NeuralDetector(dt=dt, seed=model_seed)
+    detector = _detectors[key]
+    signal = random_signal(duration, dt, changes, seed=seed)
+    events, letters = run(detector, signal)
+    reference, _ = run(ReferenceDetector(dt=dt), signal)
+    result = score(events, reference)
+    result['seed'] = seed
+    result['events'] = len(events)
+    result['reference_events'] = len(reference)
+    result['letters'] = ''.join(letters)
+    result['letters_in_order'] = letters_in_order(letters, detector.model.transitions)
+    return result
+
+
+def score_random(seeds, duration=5.0, dt=0.001, changes=10, model_seed=0, processes=None):
+    """Scores the neural detector on one random signal per seed, across a
+    pool of processes (each builds the model once)."""
+    task = functools.partial(_score_signal, duration=duration, dt=dt, changes=changes,
+                             model_seed=model_seed)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(task, seeds))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('signal', nargs='?', help='.npy file with the signal')
+    parser.add_argument('--dt', type=float, default=0.001)
+    parser.add_argument('--chunk', type=int, default=None, help='time steps per chunk')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the model')
+    parser.add_argument('--reference', action='store_true',
+                        help='only run the reference detector')
+    parser.add_argument('--random', type=int, metavar='N',
+                        help='score the detector on N random signals instead')
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--changes', type=int, default=10)
+    parser.add_argument('--processes', type=int, default=None)
+    args = parser.parse_args()
+
+    if args.random:
+        results = score_random(range(args.random), args.duration, args.dt, args.changes,
+                               args.seed, args.processes)
+        for r in results:
+            print('%(seed)6d  f1 %(f1).2f  latency %(latency).3f s  %(letters)s' % r)
+        print('mean f1 %.3f' % np.mean([r['f1'] for r in results]))
+    else:
+        signal = np.load(args.signal, mmap_mode='r')
+        if args.reference:
+            detector = ReferenceDetector(dt=args.dt)
+        else:
+            detector = NeuralDetector(dt=args.dt, seed=args.seed)
+        events, letters = run(detector, signal, args.chunk)
+        for t in events:
+            print('%.3f' % t)
+        if letters:
+            print(' '.join(letters))
@@ -0,0 +1,68 @@
+"""How the change detector scales with the number of letters (and so of
+basal ganglia actions) and the dimensionality of the vectors.
+
+For each combination this measures the build time, the wall time per
+simulated time step, and how well the model does on a random signal: the
+F1 score of its change events against ``change_batch.ReferenceDetector``,
+and the fraction of its letter steps that follow a transition.
+
+Usage::
+
+    python change_benchmark.py --letters 6 12 26 52 --dimensions 64 128 256
+    python change_benchmark.py --output results.json
+"""
+import argparse
+import json
+import timeit
+
+import change_batch
+
+
+def bench(letters, dimensions, duration=5.0, changes=10, dt=0.001, seed=0):
+    start = timeit.default_timer()
+    detector = change_batch.NeuralDetector(dt=dt, seed=seed, letters=letters,
+                                           dimensions=dimensions)
+    build = timeit.default_timer() - start
+
+    signal = change_batch.random_signal(duration, dt, changes, seed=seed)
+    start = timeit.default_timer()
+    events, sequence = change_batch.run(detector, signal)
+    step = (timeit.default_timer() - start) / len(signal)
+    reference, _ = change_batch.run(change_batch.ReferenceDetector(dt=dt), signal)
+    detector.close()
+
+    return {
+        'letters': letters,
+        'dimensions': dimensions,
+        'actions': len(detector.model.transitions) + 1,
+        'neurons': sum(e.n_neurons for e in detector.model.all_ensembles),
+        'build': build,
+        'step': step,
+        'f1': change_batch.score(events, reference)['f1'],
+        'in_order': change_batch.letters_in_order(sequence, detector.model.transitions),
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--letters', type=int, nargs='+', default=[6, 12, 26, 52])
+    parser.add_argument('--dimensions', type=int, nargs='+', default=[64, 128, 256])
+    parser.add_argument('--duration', type=float, default=5.0)
+    parser.add_argument('--changes', type=int, default=10)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='file to save the results in (JSON)')
+    args = parser.parse_args()
+
+    print('%7s %5s %7s %8s %9s %10s %5s %8s' % (
+        'letters', 'D', 'actions', 'neurons', 'build s', 'step ms', 'f1', 'in order'))
+    records = []
+    for letters in args.letters:
+        for dimensions in args.dimensions:
+            r = bench(letters, dimensions, args.duration, args.changes, seed=args.seed)
+            records.append(r)
+            print('%7d %5d %7d %8d %9.2f %10.3f %5.2f %8.2f' % (
+                r['letters'], r['dimensions'], r['actions'], r['neurons'], r['build'],
+                r['step'] * 1e3, r['f1'], r['in_order']))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=1)
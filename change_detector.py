@@ -1,20 +1,65 @@
 import nengo
 import nengo.spa as spa
-import nengo_gui
+import numpy as np
+
+from project import functions  # the batched connection functions
 
 D = 128  # the dimensionality of the vectors
 n = 200  # number of neurons in ensembles
 
-model = spa.SPA()
-with model:
+
+def letter_names(count):
+    """The first count letters: A to Z, then AA, AB and so on."""
+    names = []
+    for i in range(count):
+        name = ''
+        i += 1
+        while i > 0:
+            i, r = divmod(i - 1, 26)
+            name = chr(ord('A') + r) + name
+        names.append(name)
+    return names
+
+
+def cycle(letters):
+    """Transitions that go through the letters in order, and from the last
+    back to the first."""
+    return [(letters[i - 1], letters[i]) for i in range(len(letters))]
+
+
+def make_model(seed=None, input_=0, letters=6, transitions=None, dimensions=D,
+               change_cost=0.8, letter_cost=0.2):
+    """Build the change detector.
+
+    input_ is the output of the input Node: a constant (the slider in
+    nengo_gui), or a function of time to play back a recorded signal.
+    letters is the number of letters or a list of their names, and
+    transitions a list of (letter, next letter) pairs: on a change the
+    output goes from the letter to the next one. By default the letters
+    are gone through in a cycle.
+    """
+    if not isinstance(letters, (list, tuple)):
+        letters = letter_names(letters)
+    if transitions is None:
+        transitions = cycle(letters)
+    model = spa.SPA(seed=seed)
+    with model:
+        build(model, input_, letters, transitions, dimensions, change_cost, letter_cost)
+    return model
+
+
+def build(model, input_, letters, transitions, D, change_cost, letter_cost):
     # Deals with the detection of a change
-    model.input_ = nengo.Node(0)  # Input slider
+    model.input_ = nengo.Node(input_)  # Input slider
     model.change_input = nengo.Ensemble(n_neurons=n, dimensions=1)  # Neuron representation of input
     nengo.Connection(model.input_, model.change_input)
 
+    rng = np.random.RandomState(model.seed)  # eval points of the connections below
+    vocab_rng = np.random.RandomState(model.seed)  # so the seed fixes the vectors too
+
     def detect_change(x):
         """Output the difference between inputs"""
-        return x[0] - x[1]
+        return x[:, 0:1] - x[:, 1:2]
 
 
     def threshold(x):
@@ -22,10 +67,7 @@ with model:
 
         I chose 0.8 to make sure the firing signal doesn't fire on small changes and to make it shorter
         """
-        if abs(x) > 0.8:
-            return 1
-        else:
-            return 0
+        return (np.abs(x) > 0.8).astype(float)
 
     model.change_detector = nengo.Ensemble(n_neurons=n, dimensions=2)  # Neuron representation of difference between
     #  the value of the current input and of a short while ago
@@ -33,16 +75,15 @@ with model:
     nengo.Connection(model.change_input, model.change_detector[0])
     nengo.Connection(model.change_input, model.change_detector[1],
                      synapse=0.05)  # Very small synapse to keep the signal short
-    nengo.Connection(model.change_detector, model.change_threshold,
-                     function=detect_change)
+    functions.connect(model.change_detector, model.change_threshold, detect_change, rng=rng)
 
     model.change_output = nengo.Ensemble(n_neurons=n, dimensions=1)  # Output for change detector (redundant?)
-    nengo.Connection(model.change_threshold, model.change_output, function=threshold)
+    functions.connect(model.change_threshold, model.change_output, threshold, rng=rng)
 
-    letterVocab = spa.Vocabulary(D)  # Letter vocab
-    letterVocab.parse("A+B+C+D+E+F")
+    letterVocab = spa.Vocabulary(D, rng=vocab_rng)  # Letter vocab
+    letterVocab.parse("+".join(letters))
 
-    changeVocab = spa.Vocabulary(D)  # Change vocab
+    changeVocab = spa.Vocabulary(D, rng=vocab_rng)  # Change vocab
     changeVocab.parse("CHANGE")
 
     model.changeState = spa.State(D, vocab=changeVocab)  # State for detecting change
@@ -50,20 +91,14 @@ with model:
     model.cleanup = spa.AssociativeMemory(input_vocab=letterVocab, wta_output=True)  # Memory cleanup for output letter
     model.output = spa.State(D, vocab=letterVocab)  # Output state
 
-    # Determine the weight of the change and the letter for the output rule
-    change_cost = 0.8
-    letter_cost = 0.2
+    # The weight of the change and the letter for the output rule are
+    # change_cost and letter_cost
 
     # Change to the next state (relative to the current state in cleanup memory!) if a change is detected
-    actions = spa.Actions(
-        f"{change_cost}*dot(changeState, CHANGE) + {letter_cost}*dot(cleanup, F) --> output=A",
-        f"{change_cost}*dot(changeState, CHANGE) + {letter_cost}*dot(cleanup, A) --> output=B",
-        f"{change_cost}*dot(changeState, CHANGE) + {letter_cost}*dot(cleanup, B) --> output=C",
-        f"{change_cost}*dot(changeState, CHANGE) + {letter_cost}*dot(cleanup, C) --> output=D",
-        f"{change_cost}*dot(changeState, CHANGE) + {letter_cost}*dot(cleanup, D) --> output=E",
-        f"{change_cost}*dot(changeState, CHANGE) + {letter_cost}*dot(cleanup, E) --> output=F",
-        "0.5 --> output=0"
-    )
+    actions = spa.Actions(*[
+        f"{change_cost}*dot(changeState, CHANGE) + {letter_cost}*dot(cleanup, {letter}) --> output={next_letter}"
+        for letter, next_letter in transitions
+    ] + ["0.5 --> output=0"])
     model.bg = spa.BasalGanglia(actions)
     model.thalamus = spa.Thalamus(model.bg)
 
@@ -72,4 +107,16 @@ with model:
     nengo.Connection(model.output.output, model.cleanup.am.input)  # Forward the current state to clean up memory
     nengo.Connection(model.output.output, model.output.input)  # Recursive connection to stay in current state
 
+    model.letterVocab = letterVocab
+    model.changeVocab = changeVocab
+    model.transitions = list(transitions)
+
+
+# nengo_gui runs this file as a page (with __page__ set) and shows `model`;
+# change_batch and the sweeps import it without building one
+if '__page__' in globals():
+    model = make_model()
+
+if __name__ == '__main__':
+    import nengo_gui
     nengo_gui.GUI(__file__).start()
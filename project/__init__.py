@@ -0,0 +1,4 @@
+# The colour critter and its tools. The modules import each other by their
+# own names, as they are run from this directory (python colour_critter.py,
+# nengo_gui); from the directory above, only self-contained ones such as
+# functions can be imported through the package (from project import functions).
@@ -0,0 +1,235 @@
+# Benchmarks for the grid world and the colour critter. Run from this
+# directory:
+#
+#   python benchmark.py --output results.json
+#   python benchmark.py --baseline results.json
+#
+# Every benchmark uses fixed seeds. Results are a JSON list of records with
+# the benchmark name, map size and best time per call in seconds; with
+# --baseline, anything slower than the saved results by more than
+# --tolerance is reported and the exit status is 1.
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+import nengo
+import numpy as np
+
+import grid
+import mapfile
+
+
+class Cell(grid.Cell):
+
+    def color(self):
+        if self.wall:
+            return 'black'
+        return None
+
+    def load(self, char):
+        if char == '#':
+            self.wall = True
+
+
+class LifeCell(grid.Cell):
+    alive = False
+
+    def load(self, char):
+        self.alive = char == '#'
+
+    def update(self):
+        n = sum(1 for c in self.neighbours if c.alive)
+        self.alive = n == 3 or (self.alive and n == 2)
+
+
+def life_rule(world, old, new):
+    n = world.neighbour_values(old['alive']).sum(axis=-1)
+    new['alive'][:] = (n == 3) | (old['alive'] & (n == 2))
+
+
+def random_map(size, seed=0, wall_fraction=0.2, colours=''):
+    # Walled in, and the cell at (1, 1) is always free so agents can start
+    # there
+    rng = random.Random(seed)
+    rows = [['#' if rng.random() < wall_fraction or i in (0, size - 1) or j in (0, size - 1)
+             else ' ' for i in range(size)] for j in range(size)]
+    rows[1][1] = ' '
+    for c in colours:
+        rows[rng.randrange(1, size - 1)][rng.randrange(1, size - 1)] = c
+    return '\n'.join(''.join(row) for row in rows)
+
+
+def best_time(func, repeat=5, number=1):
+    return min(timeit.repeat(func, repeat=repeat, number=number)) / number
+
+
+def bench_grid(size):
+    random.seed(0)
+    np.random.seed(0)
+    results = {}
+    world_map = random_map(size)
+    repeat = 5 if size <= 100 else 2
+
+    results['World.__init__'] = best_time(
+        lambda: grid.World(Cell, map=world_map, directions=4), repeat=repeat)
+    results['World.__init__ (compact)'] = best_time(
+        lambda: grid.World(Cell, map=world_map, directions=4, compact=True), repeat=repeat)
+    world = grid.World(Cell, map=world_map, directions=4)
+    results['World.load'] = best_time(lambda: world.load(map=world_map), repeat=repeat)
+
+    filename = os.path.join(tempfile.mkdtemp(), 'map')
+    mapfile.ascii_to_binary(world_map, filename, Cell, directions=4)
+    results['mapfile.load_world (binary)'] = best_time(
+        lambda: mapfile.load_world(Cell, filename), repeat=repeat)
+    os.remove(filename)
+
+    life = grid.World(LifeCell, map=world_map)
+    results['World.update (Cell.update)'] = best_time(life.update, repeat=repeat)
+    life = grid.World(LifeCell, map=world_map, rule=life_rule)
+    results['World.update (rule)'] = best_time(life.update, repeat=repeat)
+
+    agent = grid.Agent()
+    world.add(agent, x=1, y=1, dir=0)
+    start = agent.cell
+    target = world.get_cell(size - 2, size - 2)
+
+    def go_towards():
+        agent.cell = start
+        agent.go_towards(target)
+    results['Agent.go_towards'] = best_time(go_towards, number=100)
+
+    def find_path():
+        world._distance_fields.clear()
+        world.find_path(start, target)
+    results['World.find_path (A*)'] = best_time(find_path, repeat=repeat)
+
+    body = grid.ContinuousAgent()
+    world.add(body, x=1, y=1, dir=0)
+
+    def go_in_direction():
+        body.go_in_direction(1.5, 0.01)
+        body.go_in_direction(3.5, 0.01)
+    results['ContinuousAgent.go_in_direction'] = best_time(go_in_direction, number=100) / 2
+
+    angles = np.linspace(-0.5, 0.5, 3) + 1.5
+    results['ContinuousAgent.detect_many (3 rays)'] = best_time(
+        lambda: body.detect_many(angles, max_distance=4), number=100)
+    results['ContinuousAgent.detect_stepwise (3 rays)'] = best_time(
+        lambda: [body.detect_stepwise(d, max_distance=4) for d in angles], number=100)
+
+    # The cell layer of the SVG is cached between frames, so compare drawing
+    # a frame from scratch with drawing one where only the agents have moved
+    for i in range(10):
+        world.add(grid.ContinuousAgent())
+    # (a Node has to be made inside a network)
+    with nengo.Network():
+        node = grid.GridNode(world)
+
+    results['World.agents_within'] = best_time(
+        lambda: world.agents_within(body.x, body.y, 5), number=100)
+    results['World.nearest_agent'] = best_time(
+        lambda: world.nearest_agent(body.x, body.y, exclude=body), number=100)
+
+    def full_frame():
+        node.cell_layer = None
+        node.generate_svg(world)
+
+    def cached_frame():
+        body.turn(0.1)
+        node.generate_svg(world)
+    results['GridNode.generate_svg (full)'] = best_time(full_frame, repeat=repeat)
+    results['GridNode.generate_svg (cached)'] = best_time(cached_frame, number=20)
+    return results
+
+
+def bench_critter(size):
+    import colour_critter
+
+    np.random.seed(0)
+    world_map = random_map(size, colours='RGBMY' * max(1, size // 10))
+    model = colour_critter.make_model(world_map=world_map, seed=0, start=(1, 1, 1))
+    body = model.body
+    results = {}
+
+    # all sensor readings, when the agent stands still (cached) and when it
+    # has moved since the last time step
+    results['colour_critter.sense (cached)'] = best_time(
+        lambda: model.sensors.output(0.0), number=100)
+
+    def moved():
+        body.turn(0.01)
+        model.sensors.output(0.0)
+    results['colour_critter.sense'] = best_time(moved, number=100)
+    return results
+
+
+def bench_model():
+    import nengo
+    import colour_critter
+
+    model = colour_critter.make_model(seed=0)
+    results = {}
+    start = timeit.default_timer()
+    sim = nengo.Simulator(model, progress_bar=False)
+    results['nengo.Simulator build'] = timeit.default_timer() - start
+    with sim:
+        steps = 200
+        start = timeit.default_timer()
+        sim.run_steps(steps)
+        results['simulator step'] = (timeit.default_timer() - start) / steps
+    return results
+
+
+def run(sizes, model=True):
+    records = []
+    for size in sizes:
+        for name, seconds in sorted(bench_grid(size).items()):
+            records.append({'name': name, 'size': size, 'seconds': seconds})
+        for name, seconds in sorted(bench_critter(size).items()):
+            records.append({'name': name, 'size': size, 'seconds': seconds})
+    if model:
+        for name, seconds in sorted(bench_model().items()):
+            records.append({'name': name, 'size': 10, 'seconds': seconds})
+    return records
+
+
+def compare(records, baseline, tolerance=0.25):
+    # Records that are more than `tolerance` (relative) slower than the
+    # matching baseline record, as (record, baseline seconds) pairs
+    saved = dict(((r['name'], r['size']), r['seconds']) for r in baseline)
+    slower = []
+    for r in records:
+        before = saved.get((r['name'], r['size']))
+        if before is not None and r['seconds'] > before * (1 + tolerance):
+            slower.append((r, before))
+    return slower
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 300])
+    parser.add_argument('--no-model', action='store_true',
+                        help='skip building and running the nengo model')
+    parser.add_argument('--output', help='file to save the results in (JSON)')
+    parser.add_argument('--baseline', help='results (JSON) to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.25)
+    args = parser.parse_args()
+
+    records = run(args.sizes, model=not args.no_model)
+    for r in records:
+        print('%-45s %6d %12.6f ms' % (r['name'], r['size'], r['seconds'] * 1e3))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(records, f, indent=1)
+    if args.baseline:
+        with open(args.baseline) as f:
+            slower = compare(records, json.load(f), args.tolerance)
+        for r, before in slower:
+            print('REGRESSION %s (size %d): %.6f ms, was %.6f ms' % (
+                r['name'], r['size'], r['seconds'] * 1e3, before * 1e3))
+        if slower:
+            sys.exit(1)
@@ -1,3 +1,6 @@
+import collections
+
+import functions
 import grid
 import nengo
 import nengo.spa as spa
@@ -20,6 +23,8 @@ mymap="""
 
 #### Preliminaries - this sets up the agent and the environment ################ 
 class Cell(grid.Cell):
+    # storage type of cellcolor when the world is compact
+    layer_dtypes = {'cellcolor': np.uint8}
 
     def color(self):
         if self.wall:
@@ -54,11 +59,6 @@ class Cell(grid.Cell):
             self.cellcolor = 5
             
             
-world = grid.World(Cell, map=mymap, directions=int(4))
-
-body = grid.ContinuousAgent()
-world.add(body, x=1, y=2, dir=2)
-
 #this defines the RGB values of the colours. We use this to translate the "letter" in 
 #the map to an actual colour. Note that we could make some or all channels noisy if we
 #wanted to
@@ -71,283 +71,524 @@ col_values = {
     5: [0.8, 0.8, 0.2], # Yellow
 }
 
+# names of the colours, as used in the vocabularies below
+col_names = {
+    0: 'WHITE',
+    1: 'GREEN',
+    2: 'RED',
+    3: 'BLUE',
+    4: 'MAGENTA',
+    5: 'YELLOW',
+}
+
 noise_val = 0.1 # how much noise there will be in the colour info
 
-#You do not have to use spa.SPA; you can also do this entirely with nengo.Network()
-model = spa.SPA()
-with model:
+#--------------------------------------------------------------------------#
+# How faithfully each part of the model is simulated. n_neurons is used    #
+# for the plain ensembles of a subsystem, dimensions for its vocabularies  #
+# and neuron_type for all its ensembles. Action selection (basal ganglia,  #
+# thalamus, clean-up memories) needs real neurons, so it runs with LIFRate #
+# neurons in a subsystem set to nengo.Direct                               #
+#--------------------------------------------------------------------------#
+Fidelity = collections.namedtuple('Fidelity', ['n_neurons', 'dimensions', 'neuron_type'])
+
+fidelity_presets = {
+    'spiking': Fidelity(n_neurons=1024, dimensions=256, neuron_type=nengo.LIF()),
+    'rate': Fidelity(n_neurons=1024, dimensions=256, neuron_type=nengo.LIFRate()),
+    'direct': Fidelity(n_neurons=1, dimensions=256, neuron_type=nengo.Direct()),
+}
+
+# colour perception, colour memory, illegal move detection and wall avoidance
+subsystems = ('perception', 'memory', 'illegal_move', 'avoidance')
+
+
+def get_fidelity(fidelity=None):
+    # Fidelity for each subsystem, from a preset name or Fidelity for all of
+    # them, or a dict giving one per subsystem (the rest are 'spiking')
+    if not isinstance(fidelity, dict):
+        fidelity = dict.fromkeys(subsystems, fidelity)
+    settings = {}
+    for name in subsystems:
+        setting = fidelity.get(name)
+        if setting is None:
+            setting = 'spiking'
+        if not isinstance(setting, Fidelity):
+            setting = fidelity_presets[setting]
+        settings[name] = setting
+    return settings
+
+
+def set_neuron_type(objs, neuron_type):
+    for obj in objs:
+        if isinstance(obj, nengo.Ensemble):
+            obj.neuron_type = neuron_type
+            continue
+        action_selection = isinstance(obj, (spa.BasalGanglia, spa.Thalamus, spa.AssociativeMemory))
+        for ens in obj.all_ensembles:
+            if action_selection and isinstance(neuron_type, nengo.Direct):
+                ens.neuron_type = nengo.LIFRate()
+            else:
+                ens.neuron_type = neuron_type
+
+
+#--------------------------------------------------------------------------#
+# The agent's sensors, in the order of the sensors node's output. Each can  #
+# be read at its own rate: `sample_period` is the time (in seconds) between #
+# readings, None for every time step, and the last reading is held in       #
+# between. With `interpolate` the reading is extrapolated from the last two #
+# instead, and with `resample_on_cell_change` a new reading is taken as     #
+# soon as the agent enters another cell. Each setting can be given for all  #
+# sensors at once or as a dict per sensor                                   #
+#--------------------------------------------------------------------------#
+sensor_names = ('proximity_sensors', 'current_color', 'ahead_color')
+
+
+def per_sensor(setting, default):
+    if not isinstance(setting, dict):
+        setting = dict.fromkeys(sensor_names, setting)
+    return dict((name, setting.get(name, default)) for name in sensor_names)
+
+
+#--------------------------------------------------------------------------#
+# The weights and thresholds of the basal ganglia rules. memory_* are the   #
+# rules that remember the visited colours (obj_w weighs the previous colour #
+# in the sequence, col_w the current colour, and mem_w is how strongly it   #
+# is stored), move_* those that detect a visited colour ahead, and          #
+# colour_threshold that of the colour recognition rules. A threshold is     #
+# the utility of the rule that does nothing                                 #
+#--------------------------------------------------------------------------#
+default_weights = {
+    'memory_obj_w': 0.4,
+    'memory_col_w': 0.8,
+    'mem_w': 2,
+    'memory_threshold': 0.8,
+    'colour_threshold': 0.8,
+    'move_obj_w': 0.8,
+    'move_col_w': 0.4,
+    'move_threshold': 0.8,
+}
+
+
+def get_weights(weights=None):
+    # default_weights, with those in weights instead
+    unknown = set(weights or {}) - set(default_weights)
+    if unknown:
+        raise ValueError('unknown weights: %s' % ', '.join(sorted(unknown)))
+    return dict(default_weights, **(weights or {}))
+
+
+#--------------------------------------------------------------------------#
+# Builds the world, the agent and the model. Everything random (the model, #
+# the colour noise) is drawn from `seed`; `start` is the agent's x, y and  #
+# direction, `fidelity` is passed to get_fidelity and the sampling         #
+# settings are described above. A telemetry.Recorder given as `recorder`   #
+# gets the agent's state every time step, and `weights` (a dict) overrides #
+# any of the default_weights                                               #
+#--------------------------------------------------------------------------#
+def make_model(world_map=mymap, seed=None, start=(1, 2, 2), fidelity=None,
+               sample_period=None, interpolate=False, resample_on_cell_change=False,
+               recorder=None, weights=None):
+
+    weights = get_weights(weights)
+    fidelity = get_fidelity(fidelity)
+    perception = fidelity['perception']
+    memory = fidelity['memory']
+    illegal_move = fidelity['illegal_move']
+    avoidance = fidelity['avoidance']
+
+    world = grid.World(Cell, map=world_map, directions=int(4))
+    # build the index look_ahead uses now rather than on the first time step
+    world.get_look_ahead_table('cellcolor')
+
+    body = grid.ContinuousAgent()
+    x, y, direction = start
+    world.add(body, x=x, y=y, dir=direction)
+    body.collisions = 0 # number of times the agent bumped into a wall
+    body.blocked = False # whether its last step was, so pushing on counts once
+
+    rng = np.random.RandomState(seed)
+    vocab_rng = np.random.RandomState(seed)
+    eval_rng = np.random.RandomState(seed)  # eval points of the function connections
+
+    #You do not have to use spa.SPA; you can also do this entirely with nengo.Network()
+    model = spa.SPA(seed=seed)
+    with model:
     
-    # create a node to connect to the world we have created (so we can see it)
-    env = grid.GridNode(world, dt=0.005)
-
-    ### Input and output nodes - how the agent sees and acts in the world ######
-
-    #--------------------------------------------------------------------------#
-    # This is the output node of the model and its corresponding function.     #
-    # It has two values that define the speed and the rotation of the agent    #
-    #--------------------------------------------------------------------------#
-    def move(t, x):
-        speed, rotation = x
-        dt = 0.001
-        max_speed = 20.0
-        max_rotate = 10.0
-        body.turn(rotation * dt * max_rotate)
-        body.go_forward(speed * dt * max_speed)
-        
-    movement = nengo.Node(move, size_in=2)
+        # create a node to connect to the world we have created (so we can see it)
+        env = grid.GridNode(world, dt=0.005)
+
+        ### Input and output nodes - how the agent sees and acts in the world ######
+
+        #--------------------------------------------------------------------------#
+        # Input node and its function: everything the agent senses, read once per  #
+        # time step. The output is split into:                                     #
+        #   [0:3] 3 proximity sensors to detect walls up to some maximum distance  #
+        #         ahead                                                            #
+        #   [3:6] the colour of the current cell of the agent                      #
+        #   [6:9] the colour of the next non-white cell (if any) ahead of the      #
+        #         agent. We cannot see through walls.                              #
+        # The readings only change when the agent moves or the world changes, so   #
+        # they are kept until then; the colour noise is new with every reading.    #
+        # Each sensor is sampled as set by make_model's sampling settings          #
+        #--------------------------------------------------------------------------#
+        sense_cache = {'key': None, 'output': np.zeros(9)}
+        periods = per_sensor(sample_period, None)
+        extrapolate = per_sensor(interpolate, False)
+        on_cell_change = per_sensor(resample_on_cell_change, False)
+        held = dict((name, {'t': None, 'value': np.zeros(3), 'slope': np.zeros(3)})
+                    for name in sensor_names)
+        last_cell = [body.cell]
+        upper = np.array([4.0] * 3 + [1.0] * 6) # the largest possible readings
+
+        def read(name):
+            key = (body.x, body.y, body.dir, body.cell, world.version)
+            if key != sense_cache['key']:
+                angles = (np.linspace(-0.5, 0.5, 3) + body.dir) % world.directions
+                # precomputed by the world, see grid.World.get_look_ahead_table
+                ahead, _ = world.look_ahead(body.cell, body.dir, 'cellcolor')
+                sense_cache['key'] = key
+                sense_cache['proximity_sensors'] = body.detect_many(angles, max_distance=4)[0]
+                sense_cache['current_color'] = col_values.get(body.cell.cellcolor)
+                sense_cache['ahead_color'] = col_values.get(ahead.cellcolor)
+
+            if name == 'proximity_sensors':
+                return sense_cache[name]
+            noise = rng.normal(0, noise_val, 3)
+            return np.clip(sense_cache[name] + noise, 0, 1)
+
+        def sense(t):
+            moved = body.cell != last_cell[0]
+            last_cell[0] = body.cell
+            out = np.empty(9)
+            for i, name in enumerate(sensor_names):
+                sample = held[name]
+                period = periods[name]
+                if sample['t'] is not None and t <= sample['t']:
+                    # the simulator was reset (t starts again from 0)
+                    sample['t'] = None
+                    sample['slope'] = np.zeros(3)
+                if (sample['t'] is None or period is None or t >= sample['t'] + period - 1e-9
+                        or (moved and on_cell_change[name])):
+                    value = read(name)
+                    if sample['t'] is not None and t > sample['t']:
+                        sample['slope'] = (value - sample['value']) / (t - sample['t'])
+                    sample['t'] = t
+                    sample['value'] = value
+                    out[3 * i:3 * i + 3] = value
+                elif extrapolate[name]:
+                    out[3 * i:3 * i + 3] = sample['value'] + sample['slope'] * (t - sample['t'])
+                else:
+                    out[3 * i:3 * i + 3] = sample['value']
+            sense_cache['output'] = np.clip(out, 0, upper)
+            return sense_cache['output']
+
+        sensors = nengo.Node(sense)
+
+        # the separate readings, for connecting to and for the gui
+        proximity_sensors = nengo.Node(size_in=3)
+        nengo.Connection(sensors[0:3], proximity_sensors, synapse=None)
+        current_color = nengo.Node(size_in=3)
+        nengo.Connection(sensors[3:6], current_color, synapse=None)
+        ahead_color = nengo.Node(size_in=3)
+        nengo.Connection(sensors[6:9], ahead_color, synapse=None)
     
-    #--------------------------------------------------------------------------#
-    # First input node and its function: 3 proximity sensors to detect walls   #
-    # up to some maximum distance ahead                                        #
-    #--------------------------------------------------------------------------#
-    def detect(t):
-        angles = (np.linspace(-0.5, 0.5, 3) + body.dir) % world.directions
-        return [body.detect(d, max_distance=4)[0] for d in angles]
-    proximity_sensors = nengo.Node(detect)
-
-    #--------------------------------------------------------------------------#
-    # Second input node and its function: the colour of the current cell of    #
-    # agent                                                                    #
-    #--------------------------------------------------------------------------#
-    def cell2rgb(t):
-        
-        c = col_values.get(body.cell.cellcolor)
-        noise = np.random.normal(0, noise_val,3)
-        c = np.clip(c + noise, 0, 1)
-        
-        return c
-        
-    current_color = nengo.Node(cell2rgb)
-     
-    #--------------------------------------------------------------------------#
-    # Final input node and its function: the colour of the next non-whilte     #
-    # cell (if any) ahead of the agent. We cannot see through walls.           #
-    #--------------------------------------------------------------------------#
-    def look_ahead(t):
-        
-        done = False
-        
-        cell = body.cell.neighbour[int(body.dir)]
-        if cell.cellcolor > 0:
-            done = True 
-            
-        while cell.neighbour[int(body.dir)].wall == False and not done:
-            cell = cell.neighbour[int(body.dir)]
-            
-            if cell.cellcolor > 0:
-                done = True
-        
-        c = col_values.get(cell.cellcolor)
-        noise = np.random.normal(0, noise_val,3)
-        c = np.clip(c + noise, 0, 1)
-        
-        return c
+        #--------------------------------------------------------------------------#
+        # This is the output node of the model and its corresponding function.     #
+        # It has two values that define the speed and the rotation of the agent    #
+        #--------------------------------------------------------------------------#
+        # time of the last step, to move by the simulator's actual dt
+        last_t = [0.0]
+
+        def move(t, x):
+            speed, rotation = x
+            # (t starts again from 0 when the simulator is reset)
+            dt = t - last_t[0] if t > last_t[0] else t
+            last_t[0] = t
+            max_speed = 20.0
+            max_rotate = 10.0
+            body.turn(rotation * dt * max_rotate)
+            blocked = not body.go_forward(speed * dt * max_speed)
+            if blocked and not body.blocked:
+                body.collisions += 1
+            body.blocked = blocked
+            # (nengo calls move once with t=0 when the node is made; that is
+            # not a step)
+            if recorder is not None and t > 0:
+                recorder.record(t, body.x, body.y, body.dir, body.cell.cellcolor,
+                                sense_cache['output'], x)
         
-    ahead_color = nengo.Node(look_ahead)    
+        movement = nengo.Node(move, size_in=2)
     
-    ### Agent functionality - your code adds to this section ###################
-    N = 1024
-    D = 256
-
-    #All input nodes should feed into one ensemble. Here is how to do this for
-    #the radar, see if you can do it for the others
-    walldist = nengo.Ensemble(n_neurons=N, dimensions=3, radius=4)
-    nengo.Connection(proximity_sensors, walldist)
-
-    #For now, all our agent does is wall avoidance. It uses values of the radar
-    #to: a) turn away from walls on the sides and b) slow down in function of 
-    #the distance to the wall ahead, reversing if it is really close
-    def movement_func(x):
-        turn = x[2] - x[0]
-        spd = (x[1] - 0.5)/2
-        return spd, turn
+        ### Agent functionality - your code adds to this section ###################
+        D = perception.dimensions
+
+        #All input nodes should feed into one ensemble. Here is how to do this for
+        #the radar, see if you can do it for the others
+        walldist = nengo.Ensemble(n_neurons=avoidance.n_neurons, dimensions=3, radius=4)
+        nengo.Connection(proximity_sensors, walldist)
+
+        #For now, all our agent does is wall avoidance. It uses values of the radar
+        #to: a) turn away from walls on the sides and b) slow down in function of 
+        #the distance to the wall ahead, reversing if it is really close
+        #(functions.movement)
     
-    #the movement function is only driven by information from the radar, so we
-    #can connect the radar ensemble to the output node with this function 
-    #directly. In the assignment, you will need intermediate steps
-    # nengo.Connection(walldist, movement, function=movement_func)
+        #the movement function is only driven by information from the radar, so we
+        #can connect the radar ensemble to the output node with this function 
+        #directly. In the assignment, you will need intermediate steps
+        # functions.connect(walldist, movement, functions.movement, rng=eval_rng)
     
-    # Simple ensemble to represent the observed color both current and ahead
-    cur_col_ens = nengo.Ensemble(n_neurons=N, dimensions=3, radius=1.5)
-    nengo.Connection(current_color, cur_col_ens)
-
-    next_col_ens = nengo.Ensemble(n_neurons=N, dimensions=3, radius=1.5)
-    nengo.Connection(ahead_color, next_col_ens)
-
-    # Define vocabularies for later use
-    rgb_vocab = spa.Vocabulary(D)
-    rgb_vocab.parse("BLUE+GREEN+RED")
-    col_vocab = spa.Vocabulary(D)
-    col_vocab.parse("BLUE+GREEN+RED+MAGENTA+YELLOW")
-    answer_vocab = spa.Vocabulary(D)
-    answer_vocab.parse("YES+NO")
-
-    # Create states to store semantic pointers for RGB values
-    model.cur_red = spa.State(D, vocab=rgb_vocab)
-    nengo.Connection(cur_col_ens[0], model.cur_red.input,
-                     transform=rgb_vocab["RED"].v.reshape(D, 1))
-    model.cur_green = spa.State(D, vocab=rgb_vocab)
-    nengo.Connection(cur_col_ens[1], model.cur_green.input,
-                     transform=rgb_vocab["GREEN"].v.reshape(D, 1))
-    model.cur_blue = spa.State(D, vocab=rgb_vocab)
-    nengo.Connection(cur_col_ens[2], model.cur_blue.input,
-                     transform=rgb_vocab["BLUE"].v.reshape(D, 1))
-
-    model.next_red = spa.State(D, vocab=rgb_vocab)
-    nengo.Connection(next_col_ens[0], model.next_red.input,
-                     transform=rgb_vocab["RED"].v.reshape(D, 1))
-    model.next_green = spa.State(D, vocab=rgb_vocab)
-    nengo.Connection(next_col_ens[1], model.next_green.input,
-                     transform=rgb_vocab["GREEN"].v.reshape(D, 1))
-    model.next_blue = spa.State(D, vocab=rgb_vocab)
-    nengo.Connection(next_col_ens[2], model.next_blue.input,
-                     transform=rgb_vocab["BLUE"].v.reshape(D, 1))
-
-    # These states represent the final colours
-    model.cur_color = spa.State(D, vocab=col_vocab)
-    model.next_color = spa.State(D, vocab=col_vocab)
-
-    # Create memory states for the remembrance of visited colours
-    model.seen_red = spa.State(D, vocab=answer_vocab, feedback=1)
-    model.seen_blue = spa.State(D, vocab=answer_vocab, feedback=1)
-    model.seen_green = spa.State(D, vocab=answer_vocab, feedback=1)
-    model.seen_yellow = spa.State(D, vocab=answer_vocab, feedback=1)
-    model.seen_magenta = spa.State(D, vocab=answer_vocab, feedback=1)
-
-    # Define the colour sequence
-    col_sequence = ["MAGENTA", "BLUE", "YELLOW", "GREEN", "RED"]
-
-    # Basal ganglia rules for the memory of visited colours
-    obj_w = 0.4
-    col_w = 0.8
-    mem_w = 2
-    color_memory_actions = spa.Actions(
-        f"({obj_w}                                                        + {col_w}) * dot(cur_clean_color, {col_sequence[0]}) --> seen_{col_sequence[0].lower()}={mem_w} * YES - NO",
-        f"{obj_w} * dot(seen_{col_sequence[0].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[1]}) --> seen_{col_sequence[1].lower()}={mem_w} * YES - NO",
-        f"{obj_w} * dot(seen_{col_sequence[1].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[2]}) --> seen_{col_sequence[2].lower()}={mem_w} * YES - NO",
-        f"{obj_w} * dot(seen_{col_sequence[2].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[3]}) --> seen_{col_sequence[3].lower()}={mem_w} * YES - NO",
-        f"{obj_w} * dot(seen_{col_sequence[3].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[4]}) --> seen_{col_sequence[4].lower()}={mem_w} * YES - NO",
-        "0.8 --> ",
-    )
-
-    # Basal ganglia rules for detecting the current colour
-    cur_color_recognition_actions = spa.Actions(
-        "dot(cur_red, RED) - 0.05*(dot(cur_green, GREEN) - dot(cur_blue, BLUE)) --> cur_color=RED",
-        "dot(cur_blue, BLUE) - 0.05*(dot(cur_green, GREEN) - dot(cur_red, RED)) --> cur_color=BLUE",
-        "dot(cur_green, GREEN) - 0.05*(dot(cur_red, RED) - dot(cur_blue, BLUE)) --> cur_color=GREEN",
-        "0.95*(dot(cur_red, RED) + dot(cur_green, GREEN)) - dot(cur_blue, BLUE) --> cur_color=YELLOW",
-        "0.95*(dot(cur_red, RED) + dot(cur_blue, BLUE)) - dot(cur_green, GREEN) --> cur_color=MAGENTA",
-        "0.8 --> cur_color=0",
-    )
-
-    # Basal ganglia rules for detecting the next colour
-    next_color_recognition_actions = spa.Actions(
-        "dot(next_red, RED) - 0.05*(dot(next_green, GREEN) - dot(next_blue, BLUE)) --> next_color=RED",
-        "dot(next_blue, BLUE) - 0.05*(dot(next_green, GREEN) - dot(next_red, RED)) --> next_color=BLUE",
-        "dot(next_green, GREEN) - 0.05*(dot(next_red, RED) - dot(next_blue, BLUE)) --> next_color=GREEN",
-        "0.95*(dot(next_red, RED) + dot(next_green, GREEN)) - dot(next_blue, BLUE) --> next_color=YELLOW",
-        "0.95*(dot(next_red, RED) + dot(next_blue, BLUE)) - dot(next_green, GREEN) --> next_color=MAGENTA",
-        "0.8 --> next_color=0",
-    )
-
-    # Cleanup memory for the colour detections
-    model.cur_clean_color = spa.AssociativeMemory(input_vocab=col_vocab,
-                                                  wta_output=True)
-    # Elongate the color signal with a weak feedback connection
-    nengo.Connection(model.cur_clean_color.am.output, model.cur_clean_color.am.input, transform=0.5)
-    model.next_clean_color = spa.AssociativeMemory(input_vocab=col_vocab,
-                                                   wta_output=True)
-
-    # Basal ganglia rules for detecting whether there's an already visited colour ahead
-    model.illegal_move_ahead = spa.State(D, vocab=answer_vocab)
-    obj_w = 0.8
-    col_w = 0.4
-    move_actions = spa.Actions(
-        f"{obj_w} * dot(next_clean_color, RED) + {col_w} * dot(seen_red, YES) - {col_w} * dot(cur_clean_color, RED) --> illegal_move_ahead=YES",
-        f"{obj_w} * dot(next_clean_color, BLUE) + {col_w} * dot(seen_blue, YES) - {col_w} * dot(cur_clean_color, BLUE) --> illegal_move_ahead=YES",
-        f"{obj_w} * dot(next_clean_color, GREEN) + {col_w} * dot(seen_green, YES) - {col_w} * dot(cur_clean_color, GREEN) --> illegal_move_ahead=YES",
-        f"{obj_w} * dot(next_clean_color, YELLOW) + {col_w} * dot(seen_yellow, YES) - {col_w} * dot(cur_clean_color, YELLOW) --> illegal_move_ahead=YES",
-        f"{obj_w} * dot(next_clean_color, MAGENTA) + {col_w} * dot(seen_magenta, YES) - {col_w} * dot(cur_clean_color, MAGENTA) --> illegal_move_ahead=YES",
-        "0.8 --> illegal_move_ahead=NO",
-    )
-
-    # Initiate basal ganglia's and thalamus' for the defined rules
-    model.cur_col_reg_bg = spa.BasalGanglia(cur_color_recognition_actions)
-    model.cur_col_reg_thalamus = spa.Thalamus(model.cur_col_reg_bg)
-
-    model.next_col_reg_bg = spa.BasalGanglia(next_color_recognition_actions)
-    model.next_col_reg_thalamus = spa.Thalamus(model.next_col_reg_bg)
-
-    model.col_mem_bg = spa.BasalGanglia(color_memory_actions)
-    model.col_mem_thalamus = spa.Thalamus(model.col_mem_bg)
-
-    model.move_bg = spa.BasalGanglia(move_actions)
-    model.move_thalamus = spa.Thalamus(model.move_bg)
-
-    # Actions to send colours to clean-up memory
-    mapping_actions = spa.Actions(
-        "cur_clean_color = cur_color",
-        "next_clean_color = next_color",
-    )
-
-    # Initiate cortical for cleanup connections
-    model.cortical = spa.Cortical(mapping_actions)
-
-    # Ensemble to encode semantic pointer from the illegal move detector
-    avoid_answer_pointer = nengo.Ensemble(n_neurons=N, dimensions=D, radius=1)
-    nengo.Connection(model.illegal_move_ahead.output, avoid_answer_pointer)
-
-    # Ensemble to map the illegal move semantic pointer to a value up to 1 based on its similarity to YES
-    avoid_answer = nengo.Ensemble(n_neurons=N, dimensions=1, radius=0.9)
-    nengo.Connection(avoid_answer_pointer, avoid_answer, function=lambda x: (answer_vocab.parse("YES").compare(x) * 2) - 0.1)
-
-    # Ensemble function that multiplies two dimensions
-    def product(x):
-        return x[0] * x[1]
-
-    # Ensemble function that clips the value to 0 if it is lower than 0
-    def minimum(x):
-        if x < 0:
-            return 0
-        else:
-            return x
-
-    # Weight priors for the modification of the wall distance (double the sides, halve the front)
-    turn_w = nengo.Node(output=1.2)
-    slow_w = nengo.Node(output=-0.5)
-    avoid_weights = nengo.Ensemble(n_neurons=N, dimensions=2, radius=2)
-    nengo.Connection(turn_w, avoid_weights[0])
-    nengo.Connection(slow_w, avoid_weights[1])
-
-    # Ensembles to store wall distance and multiplication weights together
-    avoid_left = nengo.Ensemble(n_neurons=N, dimensions=2, radius=4)
-    avoid_right = nengo.Ensemble(n_neurons=N, dimensions=2, radius=4)
-    avoid_speed = nengo.Ensemble(n_neurons=N, dimensions=2, radius=4)
-    nengo.Connection(avoid_weights[0], avoid_left[0])
-    nengo.Connection(walldist[0], avoid_left[1])
-    nengo.Connection(avoid_weights[0], avoid_right[0])
-    nengo.Connection(walldist[2], avoid_right[1])
-    nengo.Connection(avoid_weights[1], avoid_speed[0])
-    nengo.Connection(walldist[1], avoid_speed[1])
-
-    # Multiplies the wall distances together with their weights and stores them in an ensemble
-    # together with the avoid signal
-    avoid_course = nengo.Ensemble(n_neurons=N, dimensions=4, radius=4)
-    nengo.Connection(avoid_answer, avoid_course[0], function=minimum)
-    nengo.Connection(avoid_left, avoid_course[1], function=product)
-    nengo.Connection(avoid_right, avoid_course[3], function=product)
-    nengo.Connection(avoid_speed, avoid_course[2], function=product)
-
-    # Ensemble function that combines the avoid signal with the adjusted wall distances
-    def product_course(x):
-        return x[0] * x[1], x[0] * x[2], x[0] * x[3]
-
-    # Ensemble that encodes the adjusted wall distances, these are the normal distances
-    # if there's not visited colour ahead, and the adjusted distances if there is a
-    # visited colour ahead
-    adjusted_course = nengo.Ensemble(n_neurons=N, dimensions=3, radius=4)
-    nengo.Connection(avoid_course, adjusted_course, function=product_course)
-
-    # Map the (adjusted) wall distances to the movement node using the provided movement function
-    nengo.Connection(walldist, adjusted_course)
-    nengo.Connection(adjusted_course, movement, function=movement_func)
+        # Simple ensemble to represent the observed color both current and ahead
+        cur_col_ens = nengo.Ensemble(n_neurons=perception.n_neurons, dimensions=3, radius=1.5)
+        nengo.Connection(current_color, cur_col_ens)
+
+        next_col_ens = nengo.Ensemble(n_neurons=perception.n_neurons, dimensions=3, radius=1.5)
+        nengo.Connection(ahead_color, next_col_ens)
+
+        # Define vocabularies for later use
+        rgb_vocab = spa.Vocabulary(D, rng=vocab_rng)
+        rgb_vocab.parse("BLUE+GREEN+RED")
+        col_vocab = spa.Vocabulary(D, rng=vocab_rng)
+        col_vocab.parse("BLUE+GREEN+RED+MAGENTA+YELLOW")
+        answer_vocab = spa.Vocabulary(memory.dimensions, rng=vocab_rng)
+        answer_vocab.parse("YES+NO")
+        move_vocab = answer_vocab
+        if illegal_move.dimensions != memory.dimensions:
+            move_vocab = spa.Vocabulary(illegal_move.dimensions, rng=vocab_rng)
+            move_vocab.parse("YES+NO")
+
+        # Create states to store semantic pointers for RGB values
+        model.cur_red = spa.State(D, vocab=rgb_vocab)
+        nengo.Connection(cur_col_ens[0], model.cur_red.input,
+                         transform=rgb_vocab["RED"].v.reshape(D, 1))
+        model.cur_green = spa.State(D, vocab=rgb_vocab)
+        nengo.Connection(cur_col_ens[1], model.cur_green.input,
+                         transform=rgb_vocab["GREEN"].v.reshape(D, 1))
+        model.cur_blue = spa.State(D, vocab=rgb_vocab)
+        nengo.Connection(cur_col_ens[2], model.cur_blue.input,
+                         transform=rgb_vocab["BLUE"].v.reshape(D, 1))
+
+        model.next_red = spa.State(D, vocab=rgb_vocab)
+        nengo.Connection(next_col_ens[0], model.next_red.input,
+                         transform=rgb_vocab["RED"].v.reshape(D, 1))
+        model.next_green = spa.State(D, vocab=rgb_vocab)
+        nengo.Connection(next_col_ens[1], model.next_green.input,
+                         transform=rgb_vocab["GREEN"].v.reshape(D, 1))
+        model.next_blue = spa.State(D, vocab=rgb_vocab)
+        nengo.Connection(next_col_ens[2], model.next_blue.input,
+                         transform=rgb_vocab["BLUE"].v.reshape(D, 1))
+
+        # These states represent the final colours
+        model.cur_color = spa.State(D, vocab=col_vocab)
+        model.next_color = spa.State(D, vocab=col_vocab)
+
+        # Create memory states for the remembrance of visited colours
+        model.seen_red = spa.State(memory.dimensions, vocab=answer_vocab, feedback=1)
+        model.seen_blue = spa.State(memory.dimensions, vocab=answer_vocab, feedback=1)
+        model.seen_green = spa.State(memory.dimensions, vocab=answer_vocab, feedback=1)
+        model.seen_yellow = spa.State(memory.dimensions, vocab=answer_vocab, feedback=1)
+        model.seen_magenta = spa.State(memory.dimensions, vocab=answer_vocab, feedback=1)
+
+        # Define the colour sequence
+        col_sequence = ["MAGENTA", "BLUE", "YELLOW", "GREEN", "RED"]
+
+        # Basal ganglia rules for the memory of visited colours
+        obj_w = weights['memory_obj_w']
+        col_w = weights['memory_col_w']
+        mem_w = weights['mem_w']
+        color_memory_actions = spa.Actions(
+            f"({obj_w}                                                        + {col_w}) * dot(cur_clean_color, {col_sequence[0]}) --> seen_{col_sequence[0].lower()}={mem_w} * YES - NO",
+            f"{obj_w} * dot(seen_{col_sequence[0].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[1]}) --> seen_{col_sequence[1].lower()}={mem_w} * YES - NO",
+            f"{obj_w} * dot(seen_{col_sequence[1].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[2]}) --> seen_{col_sequence[2].lower()}={mem_w} * YES - NO",
+            f"{obj_w} * dot(seen_{col_sequence[2].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[3]}) --> seen_{col_sequence[3].lower()}={mem_w} * YES - NO",
+            f"{obj_w} * dot(seen_{col_sequence[3].lower()}, YES) + {col_w} * dot(cur_clean_color, {col_sequence[4]}) --> seen_{col_sequence[4].lower()}={mem_w} * YES - NO",
+            f"{weights['memory_threshold']} --> ",
+        )
+
+        # Basal ganglia rules for detecting the current colour
+        cur_color_recognition_actions = spa.Actions(
+            "dot(cur_red, RED) - 0.05*(dot(cur_green, GREEN) - dot(cur_blue, BLUE)) --> cur_color=RED",
+            "dot(cur_blue, BLUE) - 0.05*(dot(cur_green, GREEN) - dot(cur_red, RED)) --> cur_color=BLUE",
+            "dot(cur_green, GREEN) - 0.05*(dot(cur_red, RED) - dot(cur_blue, BLUE)) --> cur_color=GREEN",
+            "0.95*(dot(cur_red, RED) + dot(cur_green, GREEN)) - dot(cur_blue, BLUE) --> cur_color=YELLOW",
+            "0.95*(dot(cur_red, RED) + dot(cur_blue, BLUE)) - dot(cur_green, GREEN) --> cur_color=MAGENTA",
+            f"{weights['colour_threshold']} --> cur_color=0",
+        )
+
+        # Basal ganglia rules for detecting the next colour
+        next_color_recognition_actions = spa.Actions(
+            "dot(next_red, RED) - 0.05*(dot(next_green, GREEN) - dot(next_blue, BLUE)) --> next_color=RED",
+            "dot(next_blue, BLUE) - 0.05*(dot(next_green, GREEN) - dot(next_red, RED)) --> next_color=BLUE",
+            "dot(next_green, GREEN) - 0.05*(dot(next_red, RED) - dot(next_blue, BLUE)) --> next_color=GREEN",
+            "0.95*(dot(next_red, RED) + dot(next_green, GREEN)) - dot(next_blue, BLUE) --> next_color=YELLOW",
+            "0.95*(dot(next_red, RED) + dot(next_blue, BLUE)) - dot(next_green, GREEN) --> next_color=MAGENTA",
+            f"{weights['colour_threshold']} --> next_color=0",
+        )
+
+        # Cleanup memory for the colour detections
+        model.cur_clean_color = spa.AssociativeMemory(input_vocab=col_vocab,
+                                                      wta_output=True)
+        # Elongate the color signal with a weak feedback connection
+        nengo.Connection(model.cur_clean_color.am.output, model.cur_clean_color.am.input, transform=0.5)
+        model.next_clean_color = spa.AssociativeMemory(input_vocab=col_vocab,
+                                                       wta_output=True)
+
+        # Basal ganglia rules for detecting whether there's an already visited colour ahead
+        model.illegal_move_ahead = spa.State(illegal_move.dimensions, vocab=move_vocab)
+        obj_w = weights['move_obj_w']
+        col_w = weights['move_col_w']
+        move_actions = spa.Actions(
+            f"{obj_w} * dot(next_clean_color, RED) + {col_w} * dot(seen_red, YES) - {col_w} * dot(cur_clean_color, RED) --> illegal_move_ahead=YES",
+            f"{obj_w} * dot(next_clean_color, BLUE) + {col_w} * dot(seen_blue, YES) - {col_w} * dot(cur_clean_color, BLUE) --> illegal_move_ahead=YES",
+            f"{obj_w} * dot(next_clean_color, GREEN) + {col_w} * dot(seen_green, YES) - {col_w} * dot(cur_clean_color, GREEN) --> illegal_move_ahead=YES",
+            f"{obj_w} * dot(next_clean_color, YELLOW) + {col_w} * dot(seen_yellow, YES) - {col_w} * dot(cur_clean_color, YELLOW) --> illegal_move_ahead=YES",
+            f"{obj_w} * dot(next_clean_color, MAGENTA) + {col_w} * dot(seen_magenta, YES) - {col_w} * dot(cur_clean_color, MAGENTA) --> illegal_move_ahead=YES",
+            f"{weights['move_threshold']} --> illegal_move_ahead=NO",
+        )
+
+        # Initiate basal ganglia's and thalamus' for the defined rules
+        model.cur_col_reg_bg = spa.BasalGanglia(cur_color_recognition_actions)
+        model.cur_col_reg_thalamus = spa.Thalamus(model.cur_col_reg_bg)
+
+        model.next_col_reg_bg = spa.BasalGanglia(next_color_recognition_actions)
+        model.next_col_reg_thalamus = spa.Thalamus(model.next_col_reg_bg)
+
+        model.col_mem_bg = spa.BasalGanglia(color_memory_actions)
+        model.col_mem_thalamus = spa.Thalamus(model.col_mem_bg)
+
+        model.move_bg = spa.BasalGanglia(move_actions)
+        model.move_thalamus = spa.Thalamus(model.move_bg)
+
+        # Actions to send colours to clean-up memory
+        mapping_actions = spa.Actions(
+            "cur_clean_color = cur_color",
+            "next_clean_color = next_color",
+        )
+
+        # Initiate cortical for cleanup connections
+        model.cortical = spa.Cortical(mapping_actions)
+
+        # Ensemble to encode semantic pointer from the illegal move detector
+        avoid_answer_pointer = nengo.Ensemble(n_neurons=illegal_move.n_neurons,
+                                              dimensions=illegal_move.dimensions, radius=1,
+                                              neuron_type=illegal_move.neuron_type)
+        nengo.Connection(model.illegal_move_ahead.output, avoid_answer_pointer)
+
+        # Ensemble to map the illegal move semantic pointer to a value up to 1 based on its similarity to YES
+        avoid_answer = nengo.Ensemble(n_neurons=illegal_move.n_neurons, dimensions=1, radius=0.9,
+                                      neuron_type=illegal_move.neuron_type)
+        functions.connect(avoid_answer_pointer, avoid_answer,
+                          functions.similarity(move_vocab.parse("YES"), scale=2, offset=-0.1),
+                          rng=eval_rng)
+
+        # Weight priors for the modification of the wall distance (double the sides, halve the front)
+        turn_w = nengo.Node(output=1.2)
+        slow_w = nengo.Node(output=-0.5)
+        avoid_weights = nengo.Ensemble(n_neurons=avoidance.n_neurons, dimensions=2, radius=2)
+        nengo.Connection(turn_w, avoid_weights[0])
+        nengo.Connection(slow_w, avoid_weights[1])
+
+        # Ensembles to store wall distance and multiplication weights together
+        avoid_left = nengo.Ensemble(n_neurons=avoidance.n_neurons, dimensions=2, radius=4,
+                                    neuron_type=avoidance.neuron_type)
+        avoid_right = nengo.Ensemble(n_neurons=avoidance.n_neurons, dimensions=2, radius=4,
+                                     neuron_type=avoidance.neuron_type)
+        avoid_speed = nengo.Ensemble(n_neurons=avoidance.n_neurons, dimensions=2, radius=4,
+                                     neuron_type=avoidance.neuron_type)
+        nengo.Connection(avoid_weights[0], avoid_left[0])
+        nengo.Connection(walldist[0], avoid_left[1])
+        nengo.Connection(avoid_weights[0], avoid_right[0])
+        nengo.Connection(walldist[2], avoid_right[1])
+        nengo.Connection(avoid_weights[1], avoid_speed[0])
+        nengo.Connection(walldist[1], avoid_speed[1])
+
+        # Multiplies the wall distances together with their weights and stores them in an ensemble
+        # together with the avoid signal (clipped to 0 if it is lower than 0)
+        avoid_course = nengo.Ensemble(n_neurons=avoidance.n_neurons, dimensions=4, radius=4,
+                                      neuron_type=avoidance.neuron_type)
+        functions.connect(avoid_answer, avoid_course[0], functions.minimum, rng=eval_rng)
+        functions.connect(avoid_left, avoid_course[1], functions.product, rng=eval_rng)
+        functions.connect(avoid_right, avoid_course[3], functions.product, rng=eval_rng)
+        functions.connect(avoid_speed, avoid_course[2], functions.product, rng=eval_rng)
+
+        # Ensemble that encodes the adjusted wall distances, these are the normal distances
+        # if there's not visited colour ahead, and the adjusted distances if there is a
+        # visited colour ahead
+        # (functions.product_course combines the avoid signal with them)
+        adjusted_course = nengo.Ensemble(n_neurons=avoidance.n_neurons, dimensions=3, radius=4,
+                                          neuron_type=avoidance.neuron_type)
+        functions.connect(avoid_course, adjusted_course, functions.product_course, rng=eval_rng)
+
+        # Map the (adjusted) wall distances to the movement node using the provided movement function
+        nengo.Connection(walldist, adjusted_course)
+        functions.connect(adjusted_course, movement, functions.movement, rng=eval_rng)
+
+    set_neuron_type([cur_col_ens, next_col_ens, model.cur_red, model.cur_green, model.cur_blue,
+                     model.next_red, model.next_green, model.next_blue, model.cur_color,
+                     model.next_color, model.cur_col_reg_bg, model.cur_col_reg_thalamus,
+                     model.next_col_reg_bg, model.next_col_reg_thalamus,
+                     model.cur_clean_color, model.next_clean_color, model.cortical],
+                    perception.neuron_type)
+    set_neuron_type([model.seen_red, model.seen_blue, model.seen_green, model.seen_yellow,
+                     model.seen_magenta, model.col_mem_bg, model.col_mem_thalamus],
+                    memory.neuron_type)
+    set_neuron_type([model.illegal_move_ahead, model.move_bg, model.move_thalamus,
+                     avoid_answer_pointer, avoid_answer],
+                    illegal_move.neuron_type)
+    set_neuron_type([walldist, avoid_weights, avoid_left, avoid_right, avoid_speed,
+                     avoid_course, adjusted_course],
+                    avoidance.neuron_type)
+
+    # Keep hold of the world and of the parts of the network that are looked
+    # at from outside (the episode runner, the GUI layout)
+    model.world = world
+    model.body = body
+    model.env = env
+    model.sensors = sensors
+    model.movement = movement
+    model.proximity_sensors = proximity_sensors
+    model.current_color = current_color
+    model.ahead_color = ahead_color
+    model.walldist = walldist
+    model.cur_col_ens = cur_col_ens
+    model.next_col_ens = next_col_ens
+    model.avoid_answer_pointer = avoid_answer_pointer
+    model.avoid_answer = avoid_answer
+    model.turn_w = turn_w
+    model.slow_w = slow_w
+    model.avoid_weights = avoid_weights
+    model.avoid_left = avoid_left
+    model.avoid_right = avoid_right
+    model.avoid_speed = avoid_speed
+    model.avoid_course = avoid_course
+    model.adjusted_course = adjusted_course
+    return model
+
+
+# nengo_gui runs this file as a page (with __page__ set) and shows `model`.
+# Only build it then, or when run by hand, not on every import (episodes,
+# colour_env and benchmark only use make_model and the map).
+if __name__ == '__main__' or '__page__' in globals():
+    model = make_model()
+
+    # The names nengo_gui knows these objects by (see colour_critter.py.cfg)
+    world = model.world
+    body = model.body
+    env = model.env
+    movement = model.movement
+    sensors = model.sensors
+    proximity_sensors = model.proximity_sensors
+    current_color = model.current_color
+    ahead_color = model.ahead_color
+    walldist = model.walldist
+    cur_col_ens = model.cur_col_ens
+    next_col_ens = model.next_col_ens
+    avoid_answer_pointer = model.avoid_answer_pointer
+    avoid_answer = model.avoid_answer
+    turn_w = model.turn_w
+    slow_w = model.slow_w
+    avoid_weights = model.avoid_weights
+    avoid_left = model.avoid_left
+    avoid_right = model.avoid_right
+    avoid_speed = model.avoid_speed
+    avoid_course = model.avoid_course
+    adjusted_course = model.adjusted_course
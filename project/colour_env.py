@@ -0,0 +1,186 @@
+# The colour maze as a vectorised environment, in the style of gym's vector
+# environments: no neural model, just n agents, each in its own copy of the
+# world, stepped in lock-step with NumPy arrays. For non-neural controllers,
+# reward studies and making training data.
+#
+#   env = colour_env.ColourEnv(n=1000)
+#   obs = env.reset(seed=0)
+#   for i in range(10000):
+#       obs, reward, done, info = env.step(controller(obs))
+#
+# Observations are what colour_critter's sensors node gives, one row per
+# agent: the 3 wall distances, the (noisy) RGB colour of the current cell and
+# that of the next coloured cell ahead. Actions are (speed, rotation) per
+# agent, as the input of colour_critter's move node. An agent is rewarded
+# for every colour it reaches for the first time, and penalised for going
+# back onto a colour it has had already and for running into walls. An
+# episode is done when all colours in the map have been reached or after
+# max_steps, after which the agent starts again; info['final_observation']
+# holds what it saw last.
+#
+# Nothing in the world changes, so the copies of it only differ in their
+# agent and what it has reached: all of them share one grid.World, with the
+# agents as an AgentBatch (which never block each other).
+import argparse
+import time
+
+import numpy as np
+
+import colour_critter
+import functions
+import grid
+
+
+class ColourEnv(object):
+    # as in colour_critter.move
+    max_speed = 20.0
+    max_rotate = 10.0
+
+    def __init__(self, n=1, world_map=colour_critter.mymap, start=(1, 2, 2), random_start=False,
+                 dt=0.001, max_steps=60000, noise=colour_critter.noise_val, new_colour_reward=1.0,
+                 revisit_penalty=1.0, collision_penalty=0.0):
+        self.n = n
+        self.world = grid.World(colour_critter.Cell, map=world_map, directions=4)
+        self.start = start
+        self.random_start = random_start
+        self.dt = dt
+        self.max_steps = max_steps
+        self.noise = noise
+        self.new_colour_reward = new_colour_reward
+        self.revisit_penalty = revisit_penalty
+        self.collision_penalty = collision_penalty
+
+        world = self.world
+        self.colours = world.get_cell_values('cellcolor', 0).astype(int)
+        self.free = np.flatnonzero(~world.get_wall_bitmap().reshape(-1))
+        self.colour_count = int(self.colours.max()) + 1
+        # the colours an episode has to reach: those in the map, which need
+        # not be all of 1 to colour_count - 1
+        self.targets = np.setdiff1d(self.colours[self.free], [0])
+        self.rgb = np.array([colour_critter.col_values[c] for c in range(self.colour_count)])
+        self.ahead, _ = world.get_look_ahead_table('cellcolor')
+        self.sensor_offsets = np.linspace(-0.5, 0.5, 3)
+        self.upper = np.array([4.0] * 3 + [1.0] * 6)  # the largest possible readings
+
+        self.agents = grid.AgentBatch()
+        self.rng = np.random.RandomState()
+        self.reset()
+
+    def reset(self, seed=None):
+        # Starts every episode again; returns the first observations
+        if seed is not None:
+            self.rng = np.random.RandomState(seed)
+        if self.agents.world is not None:
+            self.world.remove_batch(self.agents)
+        index = self.start_cells(self.n)
+        self.world.add_batch(self.agents, x=index % self.world.width,
+                             y=index // self.world.width, dir=self.start_directions(self.n))
+        self.steps = np.zeros(self.n, dtype=int)
+        self.visited = np.zeros((self.n, self.colour_count), dtype=bool)
+        self.visited[np.arange(self.n), self.colours[self.agents.cell]] = True
+        self.visited[:, 0] = False
+        return self.observe()
+
+    def start_cells(self, n):
+        if self.random_start:
+            return self.free[self.rng.randint(len(self.free), size=n)]
+        x, y, _ = self.start
+        return np.full(n, y * self.world.width + x)
+
+    def start_directions(self, n):
+        if self.random_start:
+            return self.rng.randint(self.world.directions, size=n)
+        return np.full(n, self.start[2])
+
+    def observe(self):
+        agents = self.agents
+        world = self.world
+        directions = (agents.dir[:, None] + self.sensor_offsets) % world.directions
+        dx, dy = agents.get_heading_vectors(directions)
+        cy, cx = np.divmod(agents.cell, world.width)
+        t, _ = world.raycast(agents.x[:, None], agents.y[:, None], dx, dy, 4,
+                             cell_x=cx[:, None], cell_y=cy[:, None])
+        distance = np.where(t < 4, t * np.hypot(dx, dy), 4)
+
+        ahead = self.ahead[agents.cell, agents.dir.astype(int) % world.directions]
+        colour = np.concatenate([self.rgb[self.colours[agents.cell]],
+                                 self.rgb[self.colours[ahead]]], axis=1)
+        colour += self.rng.normal(0, self.noise, colour.shape)
+        return np.clip(np.concatenate([distance, colour], axis=1), 0, self.upper)
+
+    def step(self, actions):
+        # actions: (n, 2) speed and rotation. Returns the observations,
+        # rewards, which episodes are done (and have started again) and info
+        actions = np.asarray(actions, dtype=float)
+        agents = self.agents
+        before = self.colours[agents.cell]
+        was_blocked = agents.blocked.copy()
+        moved = agents.step(actions[:, 1] * self.dt * self.max_rotate,
+                            actions[:, 0] * self.dt * self.max_speed)
+        self.steps += 1
+
+        colour = self.colours[agents.cell]
+        entered = (colour != 0) & (colour != before)
+        rows = np.flatnonzero(entered)
+        new = np.zeros(self.n, dtype=bool)
+        new[rows] = ~self.visited[rows, colour[rows]]
+        self.visited[rows, colour[rows]] = True
+        # a bump into a wall is penalised once, not for every step pushing on
+        bumped = ~moved & ~was_blocked
+        reward = (self.new_colour_reward * new - self.revisit_penalty * (entered & ~new)
+                  - self.collision_penalty * bumped)
+
+        done = self.steps >= self.max_steps
+        if len(self.targets):
+            done |= self.visited[:, self.targets].all(axis=1)
+        observations = self.observe()
+        info = {'moved': moved, 'steps': self.steps.copy(),
+                'visited': self.visited[:, 1:].sum(axis=1)}
+        if done.any():
+            info['final_observation'] = observations[done]
+            self.restart(np.flatnonzero(done))
+            observations[done] = self.observe()[done]
+        return observations, reward, done, info
+
+    def restart(self, which):
+        # puts the agents `which` back at the start of a new episode
+        agents = self.agents
+        index = self.start_cells(len(which)).astype(np.int32)
+        np.subtract.at(agents.occupancy, agents.cell[which], 1)
+        np.add.at(agents.occupancy, index, 1)
+        agents.cell[which] = index
+        agents.y[which], agents.x[which] = np.divmod(index, self.world.width)
+        agents.dir[which] = self.start_directions(len(which))
+        agents.collisions[which] = 0
+        agents.blocked[which] = False
+        self.steps[which] = 0
+        self.visited[which] = False
+        self.visited[which, self.colours[index]] = True
+        self.visited[which, 0] = False
+
+
+def wall_avoidance(observations):
+    # the critter's default controller (see functions.movement)
+    return functions.movement(observations[:, :3])
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--envs', type=int, default=1000)
+    parser.add_argument('--steps', type=int, default=1000)
+    parser.add_argument('--dt', type=float, default=0.001)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--random-start', action='store_true')
+    args = parser.parse_args()
+
+    env = ColourEnv(args.envs, dt=args.dt, random_start=args.random_start)
+    observations = env.reset(seed=args.seed)
+    total = np.zeros(args.envs)
+    start = time.time()
+    for i in range(args.steps):
+        observations, reward, done, info = env.step(wall_avoidance(observations))
+        total += reward
+    elapsed = time.time() - start
+    print('%d steps in %.2f s (%.0f steps per minute)' % (
+        args.envs * args.steps, elapsed, args.envs * args.steps / elapsed * 60))
+    print('mean reward %.3f, colours reached %.2f' % (total.mean(), info['visited'].mean()))
@@ -0,0 +1,6 @@
+# This is a package, so pytest puts the directory above on the path; the
+# modules under test import each other from this one (see __init__.py)
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
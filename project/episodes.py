@@ -0,0 +1,206 @@
+# Runs the colour critter headless (without nengo_gui), many episodes at a
+# time. From this directory:
+#
+#   python episodes.py --episodes 100 --sim-time 30 --output results.csv
+#   python episodes.py --compare-fidelity --episodes 4
+#   python episodes.py --sweep-sample-period 0.005 0.01 0.02 0.05 --episodes 4
+import argparse
+import concurrent.futures
+import csv
+import functools
+import sys
+import time
+
+import os
+
+import nengo
+import numpy as np
+
+import colour_critter
+import model_cache
+import profiling
+import telemetry
+
+
+def run_episode(seed, world_map=colour_critter.mymap, sim_time=10.0, dt=0.001,
+                start=(1, 2, 2), cache_dir=None, keep_trajectory=False, record_dir=None,
+                decimate=1, profile=False, **model_args):
+    # model_args (fidelity, sample_period, ...) are passed to make_model. With
+    # record_dir, telemetry is written to a directory per seed in there. With
+    # profile, the result includes the time taken by each Node function (see
+    # profiling.py).
+    recorder = None
+    if record_dir is not None:
+        recorder = telemetry.Recorder(directory=os.path.join(record_dir, 'seed-%d' % seed),
+                                      decimate=decimate)
+    model = colour_critter.make_model(world_map=world_map, seed=seed, start=start,
+                                      recorder=recorder, **model_args)
+    body = model.body
+
+    # Colours in the order the agent walked onto them, and the agent's
+    # position at every time step
+    visited = []
+    trajectory = []
+
+    def observe(t):
+        colour = body.cell.cellcolor
+        if colour and (not visited or visited[-1] != colour):
+            visited.append(colour)
+        if keep_trajectory:
+            trajectory.append((body.x, body.y))
+
+    with model:
+        nengo.Node(observe, size_out=0)
+
+    profiler = profiling.Profiler(enabled=profile)
+    profiling.instrument(model, profiler)
+
+    build_start = time.time()
+    if cache_dir is not None:
+        sim = model_cache.ModelCache(cache_dir).simulator(model, dt=dt, progress_bar=False)
+    else:
+        sim = nengo.Simulator(model, dt=dt, progress_bar=False)
+    with sim:
+        run_start = time.time()
+        sim.run(sim_time)
+        run_end = time.time()
+    if recorder is not None:
+        recorder.close()
+
+    result = {
+        'seed': seed,
+        'sim_time': sim_time,
+        'visited': ' '.join(colour_critter.col_names[c] for c in visited),
+        'collisions': body.collisions,
+        'build_time': run_start - build_start,
+        'run_time': run_end - run_start,
+        'speed': sim_time / (run_end - run_start),  # sim-seconds per wall-second
+    }
+    if keep_trajectory:
+        result['trajectory'] = np.array(trajectory)
+    if profile:
+        result['profile'] = profiler.summary()
+    return result
+
+
+def run_episodes(seeds, processes=None, **kwargs):
+    # Runs one episode per seed across a pool of processes, returning the
+    # results in the order of the seeds
+    episode = functools.partial(run_episode, **kwargs)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        return list(pool.map(episode, seeds))
+
+
+def compare_runs(name, values, processes=None, **kwargs):
+    # Runs the same episodes with make_model's argument `name` set to each of
+    # the values, and compares each with the first value: how much faster it
+    # runs against how far the agent's behaviour drifts. drift is the mean
+    # distance between the two trajectories, same_visits the fraction of
+    # episodes that visit the colours in the same order
+    runs = [run_episodes(processes=processes, keep_trajectory=True,
+                         **dict(kwargs, **{name: value})) for value in values]
+    reference = runs[0]
+    report = []
+    for value, results in zip(values, runs):
+        drift = []
+        for ref, res in zip(reference, results):
+            n = min(len(ref['trajectory']), len(res['trajectory']))
+            diff = ref['trajectory'][:n] - res['trajectory'][:n]
+            drift.append(np.mean(np.hypot(diff[:, 0], diff[:, 1])))
+        report.append({
+            name: value if isinstance(value, (str, float, int, type(None))) else repr(value),
+            'run_time': np.mean([r['run_time'] for r in results]),
+            'speedup': (np.mean([r['run_time'] for r in reference]) /
+                        np.mean([r['run_time'] for r in results])),
+            'drift': np.mean(drift),
+            'same_visits': np.mean([ref['visited'] == res['visited']
+                                    for ref, res in zip(reference, results)]),
+        })
+    return report
+
+
+def compare_fidelity(seeds, settings=('spiking', 'rate', 'direct'), **kwargs):
+    # see colour_critter.get_fidelity for the settings
+    return compare_runs('fidelity', settings, seeds=seeds, **kwargs)
+
+
+def sweep_sample_period(seeds, periods=(0.005, 0.01, 0.02, 0.05, 0.1), **kwargs):
+    # Sensor sampling periods (see colour_critter.per_sensor) against reading
+    # every time step; interpolate and resample_on_cell_change can be passed on
+    return compare_runs('sample_period', (None,) + tuple(periods), seeds=seeds, **kwargs)
+
+
+def write_table(results, f):
+    writer = csv.DictWriter(f, fieldnames=list(results[0].keys()))
+    writer.writeheader()
+    writer.writerows(results)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--episodes', type=int, default=10)
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--sim-time', type=float, default=10.0)
+    parser.add_argument('--dt', type=float, default=0.001)
+    parser.add_argument('--map', help='file with the map to use instead of mymap')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--output', help='CSV file to write (default: stdout)')
+    parser.add_argument('--cache-dir', help='reuse decoders cached in this directory '
+                        '(see model_cache.py)')
+    parser.add_argument('--fidelity', choices=sorted(colour_critter.fidelity_presets),
+                        help='neurons to simulate the whole model with (default: spiking)')
+    parser.add_argument('--compare-fidelity', action='store_true',
+                        help='report the speedup and drift of each fidelity setting '
+                        'instead of the episode results')
+    parser.add_argument('--sample-period', type=float,
+                        help='seconds between sensor readings (default: every step)')
+    parser.add_argument('--interpolate', action='store_true',
+                        help='extrapolate sensor readings in between samples')
+    parser.add_argument('--resample-on-cell-change', action='store_true',
+                        help='read the sensors whenever the agent enters another cell')
+    parser.add_argument('--profile', action='store_true',
+                        help='print how long the Node functions took (to stderr)')
+    parser.add_argument('--record', metavar='DIR',
+                        help='write telemetry of every episode to DIR (see telemetry.py)')
+    parser.add_argument('--decimate', type=int, default=1,
+                        help='record only every n-th time step')
+    parser.add_argument('--sweep-sample-period', type=float, nargs='+', metavar='PERIOD',
+                        help='report the speedup and drift of each sensor sampling '
+                        'period instead of the episode results')
+    args = parser.parse_args()
+
+    world_map = colour_critter.mymap
+    if args.map:
+        with open(args.map) as f:
+            world_map = f.read()
+
+    seeds = range(args.first_seed, args.first_seed + args.episodes)
+    sampling = dict(interpolate=args.interpolate,
+                    resample_on_cell_change=args.resample_on_cell_change)
+    if args.compare_fidelity:
+        results = compare_fidelity(seeds, processes=args.processes, world_map=world_map,
+                                   sim_time=args.sim_time, dt=args.dt,
+                                   cache_dir=args.cache_dir)
+    elif args.sweep_sample_period:
+        results = sweep_sample_period(seeds, args.sweep_sample_period,
+                                      processes=args.processes, world_map=world_map,
+                                      sim_time=args.sim_time, dt=args.dt,
+                                      cache_dir=args.cache_dir, fidelity=args.fidelity,
+                                      **sampling)
+    else:
+        results = run_episodes(seeds, processes=args.processes, world_map=world_map,
+                               sim_time=args.sim_time, dt=args.dt,
+                               cache_dir=args.cache_dir, fidelity=args.fidelity,
+                               sample_period=args.sample_period, record_dir=args.record,
+                               decimate=args.decimate, profile=args.profile, **sampling)
+        if args.profile:
+            for r in results:
+                sys.stderr.write('seed %d, %.3f s run:\n' % (r['seed'], r['run_time']))
+                for name, s in sorted(r.pop('profile').items()):
+                    sys.stderr.write('  %-30s %8d calls %10.3f s %5.1f%%\n' % (
+                        name, s['calls'], s['total'], 100.0 * s['total'] / r['run_time']))
+    if args.output:
+        with open(args.output, 'w', newline='') as f:
+            write_table(results, f)
+    else:
+        write_table(results, sys.stdout)
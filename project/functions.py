@@ -0,0 +1,79 @@
+# Connection functions that work on all evaluation points at once. nengo
+# calls a connection's function once per eval point when it solves for the
+# decoders, so a Python function costs thousands of calls per connection;
+# connect() below samples the eval points itself, calls the function once
+# with all of them and gives nengo the results as an array:
+#
+#   functions.connect(avoid_left, avoid_course[1], functions.product, rng=rng)
+#
+# Every function here takes an (n, d) array of points and returns an (n, k)
+# array of values.
+import nengo
+import numpy as np
+from nengo.utils.builder import default_n_eval_points
+
+
+def product(x):
+    # x[0] * x[1]
+    return x[:, 0:1] * x[:, 1:2]
+
+
+def minimum(x):
+    # x, clipped to 0 from below
+    return np.maximum(x, 0)
+
+
+def product_course(x):
+    # x[1:4], scaled by x[0]
+    return x[:, 0:1] * x[:, 1:4]
+
+
+def movement(x):
+    # (speed, turn) from the wall distances (left, ahead, right)
+    return np.column_stack([(x[:, 1] - 0.5) / 2, x[:, 2] - x[:, 0]])
+
+
+def similarity(vector, scale=1.0, offset=0.0):
+    # How similar x is to vector (a semantic pointer or its vector), as
+    # SemanticPointer.compare (the cosine of the angle between them), times
+    # scale plus offset. The vector is normalised once, here, instead of at
+    # every point.
+    v = np.asarray(getattr(vector, 'v', vector), dtype=float)
+    v = v / np.linalg.norm(v)
+
+    def similarity(x):
+        norms = np.linalg.norm(x, axis=1)
+        cosine = np.dot(x, v) / np.where(norms == 0, 1, norms)
+        return (cosine * scale + offset)[:, None]
+    return similarity
+
+
+def pointwise(function):
+    # function as nengo calls it otherwise: on one point at a time
+    def pointwise(x):
+        return function(np.asarray(x, dtype=float)[None, :])[0]
+    pointwise.__name__ = getattr(function, '__name__', 'pointwise')
+    return pointwise
+
+
+def connect(pre, post, function, rng=np.random, n_eval_points=None, **kwargs):
+    # nengo.Connection(pre, post, function=function, **kwargs), with the
+    # function evaluated in one call. The eval points are drawn from pre's
+    # eval point distribution, as nengo would. Ensembles in direct mode (and
+    # slices of ensembles) have no decoders to solve for, so they get the
+    # function one point at a time instead.
+    if (not isinstance(pre, nengo.Ensemble) or isinstance(pre.neuron_type, nengo.Direct)
+            or 'eval_points' in kwargs):
+        return nengo.Connection(pre, post, function=pointwise(function), **kwargs)
+    if n_eval_points is None:
+        n_eval_points = pre.n_eval_points or default_n_eval_points(pre.n_neurons,
+                                                                    pre.dimensions)
+    distribution = pre.eval_points
+    if isinstance(distribution, nengo.dists.Distribution):
+        points = distribution.sample(n_eval_points, pre.dimensions, rng=rng)
+    else:
+        points = np.asarray(distribution, dtype=float)
+    # nengo scales the eval points by the radius before the function sees them
+    scale = pre.radius if kwargs.get('scale_eval_points', True) else 1.0
+    targets = function(points * scale)
+    return nengo.Connection(pre, post, eval_points=points, function=targets, **kwargs)
@@ -1,26 +1,81 @@
 # grid.py courtesy of Terry Stewart, UWaterloo
 #see https://github.com/tcstewar/syde556-1/
 
+import collections
+import heapq
 import math
 import random
 import sys
 
+import numpy as np
+
 neighbour_synonyms = ('neighbours', 'neighbors', 'neighbour', 'neighbor')
 
+# (dx, dy) of each direction for even and odd rows
+offset_tables = {
+    8: (((0, -1), (1, -1), (1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)),) * 2,
+    4: (((0, -1), (1, 0), (0, 1), (-1, 0)),) * 2,
+    6: (((1, 0), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1)),
+        ((1, 0), (1, 1), (0, 1), (-1, 0), (0, -1), (1, -1))),
+}
+
 
 class Cell(object):
     wall = False
 
     def __getattr__(self, key):
         if key in neighbour_synonyms:
-            pts = [self.world.get_point_in_direction(
-                self.x, self.y, dir) for dir in range(self.world.directions)]
-            ns = tuple([self.world.grid[y][x] for (x, y) in pts])
+            ns = tuple([self.world.get_cell_by_index(i)
+                        for i in self.world.neighbour_table[self.index]])
             for n in neighbour_synonyms:
                 self.__dict__[n] = ns
             return ns
         raise AttributeError(key)
 
+    def __setattr__(self, key, val):
+        object.__setattr__(self, key, val)
+        world = self.__dict__.get('world')
+        if world is not None:
+            world.version += 1
+
+
+class CellView(object):
+    # Lightweight stand-in for a Cell on a compact World. It only holds its
+    # position; every other attribute is read from and written to the
+    # World's per-cell arrays (see World.layers).
+    reserved = ('world', 'x', 'y', 'index')
+
+    def __init__(self, world, index):
+        d = self.__dict__
+        d['world'] = world
+        d['index'] = index
+        d['y'], d['x'] = divmod(index, world.width)
+
+    def __setattr__(self, key, val):
+        if key in self.reserved:
+            raise CellularException('%s of a compact cell is read-only' % key)
+        self.world.set_cell_value(self.index, key, val)
+
+    def __eq__(self, other):
+        return (isinstance(other, CellView) and other.world is self.world and
+                other.index == self.index)
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash((id(self.world), self.index))
+
+    @property
+    def agents(self):
+        return self.world.cell_agents.setdefault(self.index, [])
+
+
+def _layer_property(name):
+    def get(self):
+        return self.world.layers[name].item(self.index)
+    return property(get)
+
 
 class Agent(object):
     world = None
@@ -33,8 +88,14 @@ class Agent(object):
                 old.agents.remove(self)
             if val is not None:
                 val.agents.append(self)
+            world = self.__dict__.get('world')
+            if world is not None:
+                world.index_agent(self, old, val)
         self.__dict__[key] = val
 
+    def get_position(self):
+        return self.cell.x, self.cell.y
+
     def __getattr__(self, key):
         if key == 'left_cell':
             return self.get_cell_on_left()
@@ -54,10 +115,10 @@ class Agent(object):
         self.turn(1)
 
     def turn_around(self):
-        self.turn(self.world.directions / 2)
+        self.turn(self.world.directions // 2)
 
     def go_in_direction(self, dir):
-        target = self.cell.neighbour[dir]
+        target = self.world.get_cell_by_index(self.world.neighbour_table[self.cell.index, dir])
         if getattr(target, 'wall', False):
             return False
         self.cell = target
@@ -75,54 +136,69 @@ class Agent(object):
         return r
 
     def get_cell_ahead(self):
-        return self.cell.neighbour[self.dir]
+        return self.get_cell_in_direction(self.dir)
 
     def get_cell_on_left(self):
-        return self.cell.neighbour[(self.dir - 1) % self.world.directions]
+        return self.get_cell_in_direction((self.dir - 1) % self.world.directions)
 
     def get_cell_on_right(self):
-        return self.cell.neighbour[(self.dir + 1) % self.world.directions]
+        return self.get_cell_in_direction((self.dir + 1) % self.world.directions)
+
+    def get_cell_in_direction(self, dir):
+        return self.world.get_cell_by_index(self.world.neighbour_table[self.cell.index, int(dir)])
 
     def go_towards(self, target, y=None):
+        # One step along a shortest path to target (see
+        # World.get_distance_field). Returns False, without moving, if there
+        # is no way there, which includes a target that is a wall.
         if not isinstance(target, Cell):
-            target = self.world.grid[int(y)][int(target)]
+            target = self.world.get_cell(int(target), int(y))
         if self.world is None:
             raise CellularException('Agent has not been put in a World')
         if self.cell == target:
             return
-        best = None
-        for i, n in enumerate(self.cell.neighbours):
-            if n == target:
-                best = target
-                bestDir = i
-                break
-            if getattr(n, 'wall', False):
-                continue
-            dist = (n.x - target.x) ** 2 + (n.y - target.y) ** 2
-            if best is None or bestDist > dist:
-                best = n
-                bestDist = dist
-                bestDir = i
-        if best is not None:
-            if getattr(best, 'wall', False):
-                return False
-            self.cell = best
-            self.dir = bestDir
-            return True
+        distances, next_dir = self.world.get_distance_field(target)
+        dir = next_dir[self.cell.index]
+        if dir < 0:
+            return False
+        self.cell = self.world.get_cell_by_index(self.world.neighbour_table[self.cell.index, dir])
+        self.dir = int(dir)
+        return True
 
     def update(self):
         pass
 
 
 class World(object):
-    def __init__(self, cell=None, width=None, height=None, directions=8, filename=None, map=None):
+    # Agents are also kept in a spatial hash of buckets of bucket_size x
+    # bucket_size cells, updated whenever an agent changes cell, for finding
+    # the agents near a point (see agents_within and nearest_agent)
+    bucket_size = 4
+    # number of distance fields kept (see get_distance_field)
+    distance_field_cache_size = 32
+
+    def __init__(self, cell=None, width=None, height=None, directions=8, filename=None, map=None,
+                 compact=False, rule=None):
         if cell is None:
             cell = Cell
         self.Cell = cell
         self.directions = directions
+        # rule(world, old, new) updates all cells at once: old and new map
+        # each attribute to a flat array of its value in every cell, and the
+        # rule fills in new from old only (see update). It needs the arrays of
+        # a compact World.
+        self.rule = rule
+        if rule is not None:
+            compact = True
+        # A compact World keeps its cells in typed numpy arrays (one per
+        # attribute) and hands out CellView objects instead of storing Cells
+        self.compact = compact
+        if compact:
+            self.CellView = type(cell.__name__, (CellView, cell), {})
         if filename or map:
             if filename:
-                data = file(filename).readlines()
+                with open(filename) as f:
+                    data = f.readlines()
             else:
                 data = map.splitlines()
                 if len(data[0]) == 0:
@@ -137,32 +213,373 @@ class World(object):
             height = 20
         self.width = width
         self.height = height
+        self.build_topology()
         self.image = None
+        # bumped whenever a cell changes, so derived data can be cached
+        self.version = 0
+        self._wall_bitmap = None
+        self._look_ahead_tables = {}
+        self._distance_fields = collections.OrderedDict()
         self.reset()
         if filename or map:
             self.load(filename=filename, map=map)
 
+    @classmethod
+    def from_layers(cls, cell, layers, width, height, directions=8, rule=None):
+        # A compact World whose cells' attributes are given as arrays (one
+        # value per cell, e.g. from mapfile.read), which are not copied
+        world = cls(cell, width=width, height=height, directions=directions, compact=True,
+                    rule=rule)
+        for key, values in layers.items():
+            world.set_layer(key, values)
+        return world
+
     def get_cell(self, x, y):
+        if self.compact:
+            return self.CellView(self, y * self.width + x)
         return self.grid[y][x]
 
-    def find_cells(self, filter):
-        for row in self.grid:
-            for cell in row:
-                if filter(cell):
+    def get_cell_by_index(self, index):
+        if self.compact:
+            return self.CellView(self, index)
+        return self.cell_list[index]
+
+    def build_topology(self):
+        # offsets[y % 2, dir] is the (dx, dy) of direction dir, and
+        # neighbour_table[index, dir] the (wrapped) index of the neighbouring
+        # cell, where index = y * width + x. The neighbour table is only built
+        # when it is first used, so that huge worlds open quickly.
+        if self.directions not in offset_tables:
+            raise CellularException('unsupported number of directions: %s' % self.directions)
+        self.offset_table = offset_tables[self.directions]
+        self.offsets = np.array(self.offset_table, dtype=int)
+        self._neighbour_table = None
+
+    @property
+    def neighbour_table(self):
+        if self._neighbour_table is None:
+            ys, xs = np.divmod(np.arange(self.width * self.height), self.width)
+            offsets = self.offsets[ys % 2]
+            nx = (xs[:, None] + offsets[..., 0]) % self.width
+            ny = (ys[:, None] + offsets[..., 1]) % self.height
+            self._neighbour_table = (ny * self.width + nx).astype(np.int32)
+        return self._neighbour_table
+
+    def cells(self):
+        if self.compact:
+            for index in range(self.width * self.height):
+                yield self.CellView(self, index)
+        else:
+            for row in self.grid:
+                for cell in row:
                     yield cell
 
+    def find_cells(self, filter):
+        for cell in self.cells():
+            if filter(cell):
+                yield cell
+
     def reset(self):
-        self.grid = [[self._make_cell(
-            i, j) for i in range(self.width)] for j in range(self.height)]
-        self.dictBackup = [[{} for i in range(self.width)]
-                           for j in range(self.height)]
+        if self.compact:
+            self.grid = None
+            self.cell_list = None
+            self.dictBackup = None
+            self.layers = {}
+            self.back_layers = {}
+            self.cell_agents = {}
+            self.set_layer('wall', getattr(self.Cell, 'wall', False))
+        else:
+            self.grid = [[self._make_cell(
+                i, j) for i in range(self.width)] for j in range(self.height)]
+            self.cell_list = [c for row in self.grid for c in row]
+            self.dictBackup = [[{} for i in range(self.width)]
+                               for j in range(self.height)]
         self.agents = []
+        self.batches = []
+        self.buckets = {}
+        self.bucket_columns = -(-self.width // self.bucket_size)
         self.age = 0
+        self.version += 1
+
+    def set_layer(self, key, value, dtype=None):
+        # (Re)create the array holding attribute `key` of every compact cell.
+        # value is either the value of every cell, or an array with one value
+        # per cell, which is used as it is (it can be a memory-mapped file).
+        if key in CellView.reserved:
+            raise CellularException('%s cannot be stored as a layer' % key)
+        if dtype is None:
+            dtype = getattr(self.Cell, 'layer_dtypes', {}).get(key)
+        if isinstance(value, np.ndarray) and value.size == self.width * self.height:
+            self.layers[key] = value.reshape(-1)
+        else:
+            if dtype is None:
+                dtype = np.asarray(value).dtype
+            self.layers[key] = np.full(self.width * self.height, value, dtype=dtype)
+        self.version += 1
+        if not isinstance(getattr(self.CellView, key, None), property):
+            setattr(self.CellView, key, _layer_property(key))
+
+    def get_layer(self, key):
+        return self.layers[key].reshape(self.height, self.width)
+
+    def neighbour_values(self, values):
+        # values[neighbour_table]: for an array with one value per cell (flat
+        # or height x width), the values of each cell's neighbours, with the
+        # directions along a new last axis
+        values = np.asarray(values)
+        neighbours = values.reshape(-1)[self.neighbour_table]
+        return neighbours.reshape(values.shape + (self.directions,))
+
+    def set_cell_value(self, index, key, val):
+        layer = self.layers.get(key)
+        if layer is None:
+            default = getattr(self.Cell, key, None)
+            if default is None or callable(default):
+                default = np.zeros((), dtype=np.asarray(val).dtype)
+            self.set_layer(key, default)
+            layer = self.layers[key]
+        layer[index] = val
+        if layer[index] != val:
+            # the layer's dtype cannot hold val (a float in an int layer, a
+            # longer string than any so far): widen the layer and write again
+            dtype = np.result_type(layer.dtype, np.asarray(val).dtype)
+            if dtype != layer.dtype:
+                layer = self.layers[key] = layer.astype(dtype)
+                layer[index] = val
+        self.version += 1
+
+    def get_cell_values(self, key, default=0):
+        # flat array of attribute `key` of every cell
+        if self.compact:
+            if key in self.layers:
+                return self.layers[key]
+            return np.full(self.width * self.height, default)
+        return np.array([getattr(c, key, default) for c in self.cell_list])
+
+    def get_wall_bitmap(self):
+        if self.compact:
+            return self.get_layer('wall')
+        if self._wall_bitmap is None or self._wall_bitmap[0] != self.version:
+            walls = self.get_cell_values('wall', False).astype(bool)
+            self._wall_bitmap = (self.version, walls.reshape(self.height, self.width))
+        return self._wall_bitmap[1]
+
+    def get_look_ahead_table(self, key):
+        # For every cell and direction, where a look along that direction
+        # stops: the first cell with a non-zero `key`, or the last cell before
+        # a wall, starting with the neighbour in that direction. Returns the
+        # index of that cell and the number of steps to it, as two
+        # (cells, directions) arrays, rebuilt whenever a cell changes.
+        cached = self._look_ahead_tables.get(key)
+        if cached is not None and cached[0] == self.version:
+            return cached[1]
+        n = self.width * self.height
+        marked = self.get_cell_values(key) != 0
+        walls = self.get_wall_bitmap().reshape(-1)
+        targets = np.empty((n, self.directions), dtype=np.int32)
+        distances = np.empty((n, self.directions), dtype=np.int32)
+        cells = np.arange(n)
+        for d in range(self.directions):
+            ahead = self.neighbour_table[:, d]
+            stop = marked | walls[ahead]
+            # follow the chain of neighbours by pointer doubling
+            jump = np.where(stop, cells, ahead)
+            steps = np.where(stop, 0, 1)
+            for _ in range(max(1, int(math.ceil(math.log2(n))))):
+                steps = steps + steps[jump]
+                jump = jump[jump]
+            targets[:, d] = jump[ahead]
+            distances[:, d] = steps[ahead] + 1
+        self._look_ahead_tables[key] = (self.version, (targets, distances))
+        return targets, distances
+
+    def get_distance_field(self, target):
+        # For every cell, the number of steps to the target cell (-1 if it
+        # cannot be reached) and the direction of the first step (-1 at the
+        # target and where it cannot be reached), by breadth-first search
+        # from the target through the neighbour table. A wall cannot be
+        # reached at all. The most recently used fields are kept, keyed on
+        # (version, target).
+        key = (self.version, target.index)
+        cached = self._distance_fields.get(key)
+        if cached is not None:
+            self._distance_fields.move_to_end(key)
+            return cached
+        n = self.width * self.height
+        walls = self.get_wall_bitmap().reshape(-1)
+        distances = np.full(n, -1, dtype=np.int32)
+        frontier = np.array([], dtype=int)
+        if not walls[target.index]:
+            distances[target.index] = 0
+            frontier = np.array([target.index])
+        step = 0
+        while len(frontier):
+            step += 1
+            ahead = np.unique(self.neighbour_table[frontier].reshape(-1))
+            frontier = ahead[(distances[ahead] < 0) & ~walls[ahead]]
+            distances[frontier] = step
+        # first step: the neighbour that is one step closer
+        neighbours = distances[self.neighbour_table]
+        closer = (neighbours >= 0) & (neighbours == distances[:, None] - 1)
+        next_dir = np.where(closer.any(axis=1), closer.argmax(axis=1), -1)
+        next_dir[distances <= 0] = -1
+        field = (distances, next_dir)
+        self._distance_fields[key] = field
+        while len(self._distance_fields) > self.distance_field_cache_size:
+            self._distance_fields.popitem(last=False)
+        return field
+
+    def find_path(self, start, goal):
+        # Cells of a shortest path from start to goal (both included), or
+        # None if there is none (as when goal is a wall). Follows the distance
+        # field of goal if it is cached, otherwise searches with A*, using the
+        # number of steps needed without walls (wrapping around the edges) as
+        # the heuristic.
+        key = (self.version, goal.index)
+        if key in self._distance_fields:
+            distances, next_dir = self.get_distance_field(goal)
+            if distances[start.index] < 0:
+                return None
+            path = [start.index]
+            while path[-1] != goal.index:
+                path.append(self.neighbour_table[path[-1], next_dir[path[-1]]])
+            return [self.get_cell_by_index(i) for i in path]
+
+        walls = self.get_wall_bitmap().reshape(-1)
+        if walls[goal.index]:
+            return None
+        gx, gy = goal.x, goal.y
+
+        def estimate(index):
+            y, x = divmod(index, self.width)
+            dx = abs(x - gx)
+            dy = abs(y - gy)
+            dx = min(dx, self.width - dx)
+            dy = min(dy, self.height - dy)
+            if self.directions == 4:
+                return dx + dy
+            return max(dx, dy)
+
+        came_from = {start.index: None}
+        cost = {start.index: 0}
+        queue = [(estimate(start.index), 0, start.index)]
+        while queue:
+            _, steps, index = heapq.heappop(queue)
+            if index == goal.index:
+                path = []
+                while index is not None:
+                    path.append(self.get_cell_by_index(index))
+                    index = came_from[index]
+                return path[::-1]
+            if steps > cost[index]:
+                continue
+            for n in self.neighbour_table[index].tolist():
+                if walls[n] or cost.get(n, steps + 2) <= steps + 1:
+                    continue
+                cost[n] = steps + 1
+                came_from[n] = index
+                heapq.heappush(queue, (steps + 1 + estimate(n), steps + 1, n))
+        return None
+
+    def look_ahead(self, cell, dir, key):
+        # O(1) lookup in get_look_ahead_table. Fractional headings look along
+        # int(dir), the direction the cell-by-cell walk has always used.
+        targets, distances = self.get_look_ahead_table(key)
+        dir = int(dir) % self.directions
+        return (self.get_cell_by_index(targets[cell.index, dir]),
+                int(distances[cell.index, dir]))
+
+    def raycast(self, x, y, dx, dy, max_distance, cell_x=None, cell_y=None):
+        # Grid traversal (DDA) of rays starting at (x, y) and travelling
+        # (dx, dy) per unit distance through square cells centred on integer
+        # coordinates. All arguments broadcast, so a batch of rays is cast in
+        # one call. Returns the distance (in units of (dx, dy)) at which each
+        # ray enters a wall, or inf if it gets to max_distance first, and the
+        # index of that wall cell (-1 if none).
+        walls = self.get_wall_bitmap().reshape(-1)
+        x, y, dx, dy = [np.asarray(v, dtype=float) for v in (x, y, dx, dy)]
+        if cell_x is None:
+            cell_x = np.floor(x + 0.5)
+        if cell_y is None:
+            cell_y = np.floor(y + 0.5)
+        rays = np.broadcast(x, y, dx, dy, cell_x, cell_y)
+        shape = rays.shape
+
+        if rays.size <= 8:
+            # a handful of rays is quicker one at a time than with numpy
+            hits = [self._raycast_one(walls, float(a), float(b), float(c), float(d),
+                                      int(e), int(f), max_distance)
+                    for a, b, c, d, e, f in rays]
+            return (np.array([h[0] for h in hits], dtype=float).reshape(shape),
+                    np.array([h[1] for h in hits], dtype=int).reshape(shape))
+
+        x, y, dx, dy = [np.broadcast_to(v, shape).reshape(-1) for v in (x, y, dx, dy)]
+        ix = np.broadcast_to(np.asarray(cell_x, dtype=int), shape).reshape(-1).copy()
+        iy = np.broadcast_to(np.asarray(cell_y, dtype=int), shape).reshape(-1).copy()
+
+        step_x = np.sign(dx).astype(int)
+        step_y = np.sign(dy).astype(int)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            delta_x = np.where(dx != 0, np.abs(1.0 / dx), np.inf)
+            delta_y = np.where(dy != 0, np.abs(1.0 / dy), np.inf)
+            next_x = np.where(dx != 0, (ix + 0.5 * step_x - x) / dx, np.inf)
+            next_y = np.where(dy != 0, (iy + 0.5 * step_y - y) / dy, np.inf)
+        next_x = np.maximum(next_x, 0)
+        next_y = np.maximum(next_y, 0)
+
+        hit_distance = np.full(x.size, np.inf)
+        hit_index = np.full(x.size, -1, dtype=int)
+        active = np.arange(x.size)
+        while active.size > 0:
+            along_x = next_x <= next_y
+            t = np.where(along_x, next_x, next_y)
+            going = t < max_distance
+            if not going.all():
+                active, along_x, t = active[going], along_x[going], t[going]
+                ix, iy, next_x, next_y = ix[going], iy[going], next_x[going], next_y[going]
+            ix = ix + np.where(along_x, step_x[active], 0)
+            iy = iy + np.where(along_x, 0, step_y[active])
+            next_x = next_x + np.where(along_x, delta_x[active], 0)
+            next_y = next_y + np.where(along_x, 0, delta_y[active])
+
+            index = (iy % self.height) * self.width + ix % self.width
+            blocked = walls[index]
+            if blocked.any():
+                hit_distance[active[blocked]] = t[blocked]
+                hit_index[active[blocked]] = index[blocked]
+                going = ~blocked
+                active, ix, iy = active[going], ix[going], iy[going]
+                next_x, next_y = next_x[going], next_y[going]
+        return hit_distance.reshape(shape), hit_index.reshape(shape)
+
+    def _raycast_one(self, walls, x, y, dx, dy, ix, iy, max_distance):
+        # the same traversal as raycast, for a single ray
+        step_x = (dx > 0) - (dx < 0)
+        step_y = (dy > 0) - (dy < 0)
+        delta_x = abs(1.0 / dx) if dx else math.inf
+        delta_y = abs(1.0 / dy) if dy else math.inf
+        next_x = max((ix + 0.5 * step_x - x) / dx, 0) if dx else math.inf
+        next_y = max((iy + 0.5 * step_y - y) / dy, 0) if dy else math.inf
+        while True:
+            if next_x <= next_y:
+                t = next_x
+                ix += step_x
+                next_x += delta_x
+            else:
+                t = next_y
+                iy += step_y
+                next_y += delta_y
+            if not t < max_distance:
+                return math.inf, -1
+            index = (iy % self.height) * self.width + ix % self.width
+            if walls[index]:
+                return t, index
 
     def _make_cell(self, x, y):
         c = self.Cell()
         c.x = x
         c.y = y
+        c.index = y * self.width + x
         c.world = self
         c.agents = []
         return c
@@ -170,35 +587,32 @@ class World(object):
     def randomize(self):
         if not hasattr(self.Cell, 'randomize'):
             return
-        for row in self.grid:
-            for cell in row:
-                cell.randomize()
+        for cell in self.cells():
+            cell.randomize()
 
     def save(self, f=None):
         if not hasattr(self.Cell, 'save'):
             return
         if isinstance(f, type('')):
-            f = file(f, 'w')
-
-        total = ''
-        for j in range(self.height):
-            line = ''
-            for i in range(self.width):
-                line += self.grid[j][i].save()
-            total += '%s\n' % line
+            f = open(f, 'w')
+
+        lines = ('%s\n' % ''.join([self.get_cell(i, j).save() for i in range(self.width)])
+                 for j in range(self.height))
         if f is not None:
-            f.write(total)
+            f.writelines(lines)
             f.close()
         else:
-            return total
+            return ''.join(lines)
 
     def load(self, filename=None, map=None):
         if not hasattr(self.Cell, 'load'):
             return
         if filename:
             if isinstance(filename, type('')):
-                filename = file(filename)
-            lines = filename.readlines()
+                with open(filename) as f:
+                    lines = f.readlines()
+            else:
+                lines = filename.readlines()
         else:
             lines = map.splitlines()
             if len(lines[0]) == 0:
@@ -221,10 +635,15 @@ class World(object):
         for j in range(fh):
             line = lines[j]
             for i in range(min(fw, len(line))):
-                self.grid[starty + j][startx + i].load(line[i])
+                self.get_cell(startx + i, starty + j).load(line[i])
 
     def update(self):
-        if hasattr(self.Cell, 'update'):
+        if self.rule is not None:
+            self.update_layers()
+        elif hasattr(self.Cell, 'update') and self.compact:
+            raise CellularException('Cell.update is not supported on a compact World')
+        elif hasattr(self.Cell, 'update'):
+            self.version += 1
             for j, row in enumerate(self.grid):
                 for i, c in enumerate(row):
                     self.dictBackup[j][i].update(c.__dict__)
@@ -241,50 +660,131 @@ class World(object):
             for a in self.agents:
                 oldCell = a.cell
                 a.update()
+        for b in self.batches:
+            b.update()
         self.age += 1
 
-    def get_offset_in_direction(self, x, y, dir):
-        if self.directions == 8:
-            dx, dy = [(0, -1), (1, -1), (
-                1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1)][dir]
-        elif self.directions == 4:
-            dx, dy = [(0, -1), (1, 0), (0, 1), (-1, 0)][dir]
-        elif self.directions == 6:
-            if y % 2 == 0:
-                dx, dy = [(1, 0), (0, 1), (-1, 1), (-1, 0),
-                          (-1, -1), (0, -1)][dir]
-            else:
-                dx, dy = [(1, 0), (1, 1), (0, 1), (-1, 0),
-                          (0, -1), (1, -1)][dir]
-        return dx, dy
+    def update_layers(self):
+        # Synchronous update of every cell with self.rule, double buffered:
+        # the back buffers start as a copy of the current layers, the rule
+        # writes the new state into them, and then the two sets are swapped
+        old = self.layers
+        new = {}
+        for key, layer in old.items():
+            back = self.back_layers.get(key)
+            if back is None or back.dtype != layer.dtype:
+                back = np.empty_like(layer)
+            np.copyto(back, layer)
+            new[key] = back
+        self.rule(self, old, new)
+        for key, layer in new.items():
+            if key not in old:
+                self.set_layer(key, np.zeros((), dtype=layer.dtype))
+        self.layers, self.back_layers = new, old
+        self.version += 1
+        for a in self.agents:
+            a.update()
 
+    def get_offset_in_direction(self, x, y, dir):
+        return self.offset_table[y % 2][dir]
 
     def get_point_in_direction(self, x, y, dir):
-        dx, dy = self.get_offset_in_direction(x, y, dir)
-
-        x2 = x + dx
-        y2 = y + dy
-
-        if x2 < 0:
-            x2 += self.width
-        if y2 < 0:
-            y2 += self.height
-        if x2 >= self.width:
-            x2 -= self.width
-        if y2 >= self.height:
-            y2 -= self.height
-
-        return (x2, y2)
+        index = self.neighbour_table[y * self.width + x, dir]
+        return (int(index % self.width), int(index // self.width))
+
+    def get_bucket(self, cell):
+        return (cell.y // self.bucket_size) * self.bucket_columns + cell.x // self.bucket_size
+
+    def index_agent(self, agent, old=None, new=None):
+        # Moves agent from the bucket of cell old to that of cell new (either
+        # can be None). Buckets are dicts used as ordered sets. An agent
+        # can be missing from its old bucket: reset() empties the buckets but
+        # leaves the agents where they were.
+        old_bucket = None if old is None else self.get_bucket(old)
+        new_bucket = None if new is None else self.get_bucket(new)
+        if old_bucket == new_bucket:
+            return
+        bucket = self.buckets.get(old_bucket)
+        if bucket is not None:
+            bucket.pop(agent, None)
+            if not bucket:
+                del self.buckets[old_bucket]
+        if new_bucket is not None:
+            self.buckets.setdefault(new_bucket, {})[agent] = None
+
+    def _bucket_span(self, low, high, size):
+        # bucket rows or columns holding the cells low..high (wrapped around
+        # a world dimension of the given size)
+        if high - low + 1 >= size:
+            return range(-(-size // self.bucket_size))
+        return sorted(set(c % size // self.bucket_size for c in range(low, high + 1)))
+
+    def agents_within_many(self, xs, ys, radius, exclude=None):
+        # For each point (xs[i], ys[i]), the agents no further than radius
+        # from it as (agent, distance) pairs, nearest first, leaving out
+        # exclude[i]. Distances wrap around the edges of the world. Points
+        # are grouped by bucket, and each group is compared with the agents
+        # of the buckets around it in one go.
+        xs = np.asarray(xs, dtype=float).reshape(-1)
+        ys = np.asarray(ys, dtype=float).reshape(-1)
+        if exclude is None:
+            exclude = [None] * len(xs)
+        bs = self.bucket_size
+        # agents are within half a cell of their cell, and so are the points
+        reach = int(math.ceil(radius)) + 1
+        cx = np.rint(xs).astype(int) % self.width // bs
+        cy = np.rint(ys).astype(int) % self.height // bs
+        results = [[] for i in range(len(xs))]
+        groups = {}
+        for i, key in enumerate(zip(cx.tolist(), cy.tolist())):
+            groups.setdefault(key, []).append(i)
+        for (bx, by), points in groups.items():
+            candidates = []
+            for row in self._bucket_span(by * bs - reach, by * bs + bs - 1 + reach, self.height):
+                for column in self._bucket_span(bx * bs - reach, bx * bs + bs - 1 + reach,
+                                                self.width):
+                    candidates.extend(self.buckets.get(row * self.bucket_columns + column, ()))
+            if not candidates:
+                continue
+            positions = np.array([a.get_position() for a in candidates], dtype=float)
+            dx = (positions[:, 0] - xs[points, None] + self.width / 2) % self.width - self.width / 2
+            dy = (positions[:, 1] - ys[points, None] + self.height / 2) % self.height - self.height / 2
+            distance = np.hypot(dx, dy)
+            for i, d in zip(points, distance):
+                near = np.flatnonzero(d <= radius)
+                near = near[np.argsort(d[near], kind='stable')]
+                results[i] = [(candidates[j], float(d[j])) for j in near.tolist()
+                              if candidates[j] is not exclude[i]]
+        return results
+
+    def agents_within(self, x, y, radius, exclude=None):
+        return self.agents_within_many([x], [y], radius, [exclude])[0]
+
+    def nearest_agent(self, x, y, max_distance=None, exclude=None):
+        # (agent, distance) of the agent nearest to (x, y), or None. Searches
+        # ever larger areas until an agent is found.
+        if max_distance is None:
+            max_distance = self.width + self.height
+        radius = self.bucket_size
+        while True:
+            radius = min(radius, max_distance)
+            found = self.agents_within(x, y, radius, exclude)
+            if found:
+                return found[0]
+            if radius >= max_distance:
+                return None
+            radius *= 2
 
     def remove(self, agent):
         self.agents.remove(agent)
+        self.index_agent(agent, agent.cell, None)
         agent.world = None
         agent.cell = None
 
     def add(self, agent, x=None, y=None, cell=None, dir=None):
         self.agents.append(agent)
         if x is not None and y is not None:
-            cell = self.grid[y][x]
+            cell = self.get_cell(x, y)
         if cell is None:
             while True:
                 xx = x
@@ -293,7 +793,7 @@ class World(object):
                     xx = random.randrange(self.width)
                 if yy is None:
                     yy = random.randrange(self.height)
-                if not getattr(self.grid[yy][xx], 'wall', False):
+                if not getattr(self.get_cell(xx, yy), 'wall', False):
                     y = yy
                     x = xx
                     break
@@ -304,11 +804,36 @@ class World(object):
         if dir is None:
             dir = random.randrange(self.directions)
 
-        agent.cell = self.grid[y][x]
+        agent.cell = self.get_cell(x, y)
         agent.dir = dir
         agent.world = self
         agent.x = x
         agent.y = y
+        self.index_agent(agent, None, agent.cell)
+
+    def add_batch(self, batch, n=None, x=None, y=None, dir=None):
+        # Puts n agents of an AgentBatch into the world, at the given cells
+        # (arrays of x and y) or at random cells that are not walls
+        if x is None or y is None:
+            free = np.flatnonzero(~self.get_wall_bitmap().reshape(-1))
+            index = free[np.random.randint(len(free), size=n)]
+        else:
+            x, y = np.broadcast_arrays(np.asarray(x, dtype=int), np.asarray(y, dtype=int))
+            index = (y * self.width + x).reshape(-1)
+        if dir is None:
+            dir = np.random.randint(self.directions, size=len(index))
+        self.batches.append(batch)
+        batch.world = self
+        batch.cell = index.astype(np.int32)
+        batch.y, batch.x = [v.astype(float) for v in np.divmod(index, self.width)]
+        batch.dir = np.broadcast_to(np.asarray(dir, dtype=float), index.shape).copy()
+        batch.collisions = np.zeros(len(index), dtype=int)
+        batch.blocked = np.zeros(len(index), dtype=bool)
+        batch.occupancy = np.bincount(batch.cell, minlength=self.width * self.height)
+
+    def remove_batch(self, batch):
+        self.batches.remove(batch)
+        batch.world = None
 
 
 class CellularException(Exception):
@@ -317,26 +842,41 @@ class CellularException(Exception):
 	
 class ContinuousAgent(Agent):
     def go_in_direction(self, dir, distance=1, return_obstacle=False):
-
+        # Moves distance along the (possibly fractional) direction, unless a
+        # wall is in the way, in which case the agent stays where it is. The
+        # whole path is checked (as in World.raycast), so no step is too long
+        # to be stopped by a wall one cell thick. The agent ends up in the
+        # cell its position rounds to, wrapped around the edges of the world.
+        # Hexagonal worlds only check the neighbour nearest to where the agent
+        # ends up.
+
+        world = self.world
         dir1=int(dir)
-        dir2=(dir1+1)%self.world.directions
+        dir2=(dir1+1)%world.directions
 
-        dx1, dy1 = self.world.get_offset_in_direction(self.cell.x, self.cell.y, dir1)
-        dx2, dy2 = self.world.get_offset_in_direction(self.cell.x, self.cell.y, dir2)
+        offsets = world.offset_table[self.cell.y % 2]
+        dx1, dy1 = offsets[dir1]
+        dx2, dy2 = offsets[dir2]
 
         scale=dir % 1
 
-        x = self.x + distance*(dx2*scale + dx1*(1 - scale))
-        y = self.y + distance*(dy2*scale + dy1*(1 - scale))
+        dx = distance*(dx2*scale + dx1*(1 - scale))
+        dy = distance*(dy2*scale + dy1*(1 - scale))
+        if world.directions != 6:
+            return self._sweep(dx, dy, return_obstacle)
+        x = self.x + dx
+        y = self.y + dy
 
-        closest = self.cell
+        closest = self.cell.index
         dist = (x-self.cell.x)**2 + (y-self.cell.y)**2
-        for n in self.cell.neighbour:
-            d = (x-n.x)**2 + (y-n.y)**2
+        for n in world.neighbour_table[closest].tolist():
+            ny, nx = divmod(n, world.width)
+            d = (x-nx)**2 + (y-ny)**2
             if d<dist:
                 closest = n
                 dist = d
-        if closest is not self.cell:
+        if closest != self.cell.index:
+            closest = world.get_cell_by_index(closest)
             if closest.wall:
                 if return_obstacle:
                     return closest
@@ -353,13 +893,110 @@ class ContinuousAgent(Agent):
         else:
             return True
 
+    def _sweep(self, dx, dy, return_obstacle):
+        world = self.world
+        cell = self.cell
+        obstacle = None
+        if dx or dy:
+            walls = world.get_wall_bitmap().reshape(-1)
+            t, index = world._raycast_one(walls, float(self.x), float(self.y), float(dx),
+                                          float(dy), cell.x, cell.y, 1.0)
+            x = self.x + dx
+            y = self.y + dy
+            ix = int(math.floor(x + 0.5))
+            iy = int(math.floor(y + 0.5))
+            if index < 0 and (ix != cell.x or iy != cell.y):
+                # a path ending exactly on the edge of a wall cell is not
+                # caught by the ray
+                index = (iy % world.height) * world.width + ix % world.width
+                if not walls[index]:
+                    cell = world.get_cell_by_index(index)
+                    index = -1
+            if index >= 0:
+                obstacle = world.get_cell_by_index(index)
+            else:
+                if cell.index != self.cell.index:
+                    self.cell = cell
+                # keep the position by the cell when it wraps around an edge
+                self.x = x - (ix - cell.x)
+                self.y = y - (iy - cell.y)
+        if return_obstacle:
+            return obstacle
+        else:
+            return obstacle is None
+
     def go_forward(self, distance=1):
         return self.go_in_direction(self.dir, distance=distance)
 
     def go_backward(self, distance=1):
         return self.go_in_direction(self.dir, distance=-distance)
 
-    def detect(self, direction, max_distance=None):
+    def get_position(self):
+        return self.x, self.y
+
+    def get_heading_vectors(self, directions):
+        # (dx, dy) per unit distance for each (possibly fractional) direction,
+        # interpolated the same way as go_in_direction
+        directions = np.asarray(directions, dtype=float) % self.world.directions
+        offsets = self.world.offsets[self.cell.y % 2]
+        dir1 = directions.astype(int)
+        dir2 = (dir1 + 1) % self.world.directions
+        scale = (directions % 1)[..., None]
+        v = offsets[dir2] * scale + offsets[dir1] * (1 - scale)
+        return v[..., 0], v[..., 1]
+
+    def detect_many(self, directions, max_distance=None, agents=False, agent_radius=0.5):
+        # Distance to the nearest wall in each of the given directions, cast
+        # as one batch of rays. Unlike detect_stepwise this never moves the
+        # agent. Hexagonal worlds fall back to detect_stepwise. With agents,
+        # other agents (discs of agent_radius) block the rays too, and are
+        # returned as the obstacle.
+        if max_distance is None:
+            max_distance = self.world.width + self.world.height
+        if self.world.directions == 6:
+            results = [self.detect_stepwise(d, max_distance) for d in np.ravel(directions)]
+            distance, obstacles = np.array([r[0] for r in results]), [r[1] for r in results]
+        else:
+            dx, dy = self.get_heading_vectors(directions)
+            t, index = self.world.raycast(self.x, self.y, dx, dy, max_distance,
+                                          cell_x=self.cell.x, cell_y=self.cell.y)
+            distance = np.where(t < max_distance, t * np.hypot(dx, dy), max_distance)
+            obstacles = [None if i < 0 else self.world.get_cell(i % self.world.width, i // self.world.width)
+                         for i in np.ravel(index)]
+        if agents:
+            self.detect_agents(directions, distance, obstacles, agent_radius)
+        return distance, obstacles
+
+    def detect_agents(self, directions, distance, obstacles, agent_radius=0.5):
+        # Shortens distance (and replaces obstacles) where a ray hits another
+        # agent before anything else
+        world = self.world
+        others = world.agents_within(self.x, self.y, float(np.max(distance)) + agent_radius,
+                                     exclude=self)
+        if not others:
+            return
+        dx, dy = self.get_heading_vectors(np.ravel(directions))
+        norm = np.hypot(dx, dy)[:, None]
+        ux, uy = dx[:, None] / norm, dy[:, None] / norm
+        positions = np.array([a.get_position() for a, d in others], dtype=float)
+        px = (positions[:, 0] - self.x + world.width / 2) % world.width - world.width / 2
+        py = (positions[:, 1] - self.y + world.height / 2) % world.height - world.height / 2
+        along = ux * px + uy * py
+        across2 = px ** 2 + py ** 2 - along ** 2
+        hit = along - np.sqrt(np.maximum(agent_radius ** 2 - across2, 0))
+        hit = np.where((across2 <= agent_radius ** 2) & (along >= 0), np.maximum(hit, 0), np.inf)
+        nearest = np.argmin(hit, axis=1)
+        flat = distance.reshape(-1)
+        for i, j in enumerate(nearest.tolist()):
+            if hit[i, j] < flat[i]:
+                flat[i] = hit[i, j]
+                obstacles[i] = others[j][0]
+
+    def detect(self, direction, max_distance=None, agents=False):
+        distance, obstacles = self.detect_many([direction], max_distance, agents=agents)
+        return float(distance[0]), obstacles[0]
+
+    def detect_stepwise(self, direction, max_distance=None):
         start_x = self.x
         start_y = self.y
         cell = self.cell
@@ -397,12 +1034,121 @@ class ContinuousAgent(Agent):
         dy = cell.y - self.y
         return math.sqrt(dx**2 + dy**2)
 
-		
-import nengo		
+
+class AgentBatch(object):
+    # Any number of ContinuousAgents kept as arrays (x, y, dir, cell index)
+    # and moved all at once. Rather than being listed in cell.agents, the
+    # number of agents in each cell is kept in the occupancy array. Add one
+    # to a world with World.add_batch. collisions counts each agent's bumps
+    # into walls, as colour_critter does: a blocked move after one that was
+    # not, with blocked holding whether the last move was.
+    world = None
+
+    def __len__(self):
+        return len(self.cell)
+
+    def turn(self, amount):
+        self.dir = (self.dir + amount) % self.world.directions
+
+    def get_heading_vectors(self, directions=None):
+        # (dx, dy) per unit distance, interpolated as in ContinuousAgent.
+        # directions has one row per agent, e.g. (agents, sensors)
+        world = self.world
+        if directions is None:
+            directions = self.dir
+        directions = np.asarray(directions, dtype=float) % world.directions
+        offsets = world.offsets[(self.cell // world.width) % 2]
+        rows = np.arange(len(self.cell)).reshape((-1,) + (1,) * (directions.ndim - 1))
+        dir1 = directions.astype(int)
+        dir2 = (dir1 + 1) % world.directions
+        scale = directions % 1
+        dx = offsets[rows, dir2, 0] * scale + offsets[rows, dir1, 0] * (1 - scale)
+        dy = offsets[rows, dir2, 1] * scale + offsets[rows, dir1, 1] * (1 - scale)
+        return dx, dy
+
+    def go_in_direction(self, dir, distance=1):
+        # Same rules as ContinuousAgent.go_in_direction: an agent does not
+        # move at all if there is a wall anywhere on its path, and otherwise
+        # ends up in the cell its position rounds to (in hexagonal worlds, the
+        # nearest of its cell and that cell's neighbours). Returns which
+        # agents moved.
+        world = self.world
+        dx, dy = self.get_heading_vectors(dir)
+        if world.directions != 6:
+            return self._sweep(distance * dx, distance * dy)
+        x = self.x + distance * dx
+        y = self.y + distance * dy
+
+        candidates = np.concatenate([self.cell[:, None], world.neighbour_table[self.cell]], axis=1)
+        cy, cx = np.divmod(candidates, world.width)
+        dist = (x[:, None] - cx) ** 2 + (y[:, None] - cy) ** 2
+        closest = candidates[np.arange(len(candidates)), np.argmin(dist, axis=1)]
+
+        blocked = world.get_wall_bitmap().reshape(-1)[closest] & (closest != self.cell)
+        moved = ~blocked
+        self.collisions += blocked & ~self.blocked
+        self.blocked = blocked
+        changed = moved & (closest != self.cell)
+        np.subtract.at(self.occupancy, self.cell[changed], 1)
+        np.add.at(self.occupancy, closest[changed], 1)
+        self.cell = np.where(moved, closest, self.cell).astype(np.int32)
+        self.x = np.where(moved, x, self.x)
+        self.y = np.where(moved, y, self.y)
+        return moved
+
+    def _sweep(self, dx, dy):
+        world = self.world
+        walls = world.get_wall_bitmap().reshape(-1)
+        cy, cx = np.divmod(self.cell, world.width)
+        dx = np.broadcast_to(dx, self.x.shape)
+        dy = np.broadcast_to(dy, self.y.shape)
+        t, index = world.raycast(self.x, self.y, dx, dy, 1.0, cell_x=cx, cell_y=cy)
+        x = self.x + dx
+        y = self.y + dy
+        ix = np.floor(x + 0.5).astype(int)
+        iy = np.floor(y + 0.5).astype(int)
+        closest = (iy % world.height) * world.width + ix % world.width
+        # paths ending exactly on the edge of a wall cell are not caught by
+        # the rays
+        blocked = (index >= 0) | walls[closest]
+        moved = ~blocked
+        self.collisions += blocked & ~self.blocked
+        self.blocked = blocked
+        changed = moved & (closest != self.cell)
+        np.subtract.at(self.occupancy, self.cell[changed], 1)
+        np.add.at(self.occupancy, closest[changed], 1)
+        self.cell = np.where(moved, closest, self.cell).astype(np.int32)
+        # positions stay by their cells when they wrap around an edge
+        self.x = np.where(moved, x - (ix - self.cell % world.width), self.x)
+        self.y = np.where(moved, y - (iy - self.cell // world.width), self.y)
+        return moved
+
+    def go_forward(self, distance=1):
+        return self.go_in_direction(self.dir, distance)
+
+    def go_backward(self, distance=1):
+        return self.go_in_direction(self.dir, -np.asarray(distance))
+
+    def step(self, turn, forward):
+        # one turn-then-move command per agent, as colour_critter's move node
+        self.turn(turn)
+        return self.go_forward(forward)
+
+    def update(self):
+        pass
+
+
+import nengo
 # GridNode sets up the pacman world for visualization
 class GridNode(nengo.Node):
     def __init__(self, world, dt=0.001):
 
+        # The cells only change when the world does, so their SVG is kept and
+        # only rebuilt when world.version has moved on; each frame just redraws
+        # the agents on top
+        self.cell_layer = None
+        self.cell_layer_version = None
+
         # The initalizer sets up the html layout for display
         def svg(t):
             last_t = getattr(svg, '_nengo_html_t_', None)
@@ -413,6 +1159,19 @@ class GridNode(nengo.Node):
 
     # This function sets up an SVG (used to embed html code in the environment)
     def generate_svg(self, world):
+        if self.cell_layer is None or self.cell_layer_version != world.version:
+            self.cell_layer = self.generate_cell_svg(world)
+            self.cell_layer_version = world.version
+
+        # Sets up the environment as a HTML SVG
+        svg = '''<svg style="background: white" width="100%%" height="100%%" viewbox="0 0 %d %d">
+            %s
+            %s
+            </svg>''' % (world.width, world.height,
+                         self.cell_layer, self.generate_agent_svg(world))
+        return svg
+
+    def generate_cell_svg(self, world):
         cells = []
         # Runs through every cell in the world (walls & food)
         for i in range(world.width):
@@ -425,7 +1184,9 @@ class GridNode(nengo.Node):
                 if color is not None:
                     cells.append('<rect x=%d y=%d width=1 height=1 style="fill:%s"/>' %
                          (i, j, color))
+        return ''.join(cells)
 
+    def generate_agent_svg(self, world):
         # Runs through every agent in the world
         agents = []
         for agent in world.agents:
@@ -450,12 +1211,5 @@ class GridNode(nengo.Node):
                          % (color, agent.x+0.5, agent.y+0.5))
 
             agents.append(agent_poly)
-
-        # Sets up the environment as a HTML SVG
-        svg = '''<svg style="background: white" width="100%%" height="100%%" viewbox="0 0 %d %d">
-            %s
-            %s
-            </svg>''' % (world.width, world.height,
-                         ''.join(cells), ''.join(agents))
-        return svg
+        return ''.join(agents)
 	
@@ -0,0 +1,293 @@
+# Binary map files, and streaming conversion from and to ASCII maps.
+#
+# A binary map holds the cell attributes of a compact grid.World as one array
+# per attribute (a layer). The file starts with MAGIC, then the length of a
+# JSON header (4 bytes, little endian) and the header itself:
+#
+#   {"width": ..., "height": ..., "directions": ...,
+#    "layers": [{"name": ..., "dtype": ..., "offset": ..., "packed": ...}]}
+#
+# Every layer is stored at its offset (a multiple of 64) as the raw values of
+# all cells, row by row. Boolean layers (such as wall) are packed to one bit
+# per cell, each row starting on a new byte. read memory-maps the layers
+# rather than reading them, so even huge maps open in milliseconds:
+#
+#   python mapfile.py big.txt big.map
+#   world = mapfile.load_world(colour_critter.Cell, 'big.map')
+#
+# ASCII maps are read and written one row at a time, with each character
+# translated by what Cell.load makes of it.
+import argparse
+import importlib
+import json
+import struct
+
+import numpy as np
+
+import grid
+
+MAGIC = b'GRIDMAP1'
+alignment = 64
+
+
+def _align(offset):
+    return -(-offset // alignment) * alignment
+
+
+def _row_bytes(width):
+    return -(-width // 8)
+
+
+def _layout(width, height, layers, pack=True):
+    # header and total size of a file holding layers ({name: dtype})
+    entries = []
+    offset = 0
+    for name, dtype in layers.items():
+        dtype = np.dtype(dtype)
+        packed = pack and dtype == np.bool_
+        size = height * _row_bytes(width) if packed else width * height * dtype.itemsize
+        entries.append({'name': name, 'dtype': dtype.str, 'offset': offset, 'packed': packed})
+        offset = _align(offset + size)
+    return entries, offset
+
+
+def _write_header(f, width, height, directions, entries):
+    header = json.dumps({'width': width, 'height': height, 'directions': directions,
+                         'layers': entries}).encode()
+    start = _align(len(MAGIC) + 4 + len(header))
+    f.write(MAGIC)
+    f.write(struct.pack('<I', len(header)))
+    f.write(header)
+    f.write(b'\0' * (start - f.tell()))
+    return start
+
+
+def _read_header(f):
+    if f.read(len(MAGIC)) != MAGIC:
+        raise IOError('not a binary map file')
+    length, = struct.unpack('<I', f.read(4))
+    info = json.loads(f.read(length).decode())
+    return info, _align(len(MAGIC) + 4 + length)
+
+
+def _map_layer(filename, entry, start, width, height, mode):
+    offset = start + entry['offset']
+    if entry['packed']:
+        bits = np.memmap(filename, dtype=np.uint8, mode=mode, offset=offset,
+                         shape=(height, _row_bytes(width)))
+        return bits
+    return np.memmap(filename, dtype=np.dtype(entry['dtype']), mode=mode, offset=offset,
+                     shape=(width * height,))
+
+
+def write(filename, layers, width, height, directions=8, pack=True):
+    # layers maps each attribute to an array with its value in every cell
+    layers = dict((name, np.asarray(values).reshape(-1)) for name, values in layers.items())
+    entries, size = _layout(width, height, dict((n, v.dtype) for n, v in layers.items()), pack)
+    with open(filename, 'wb') as f:
+        start = _write_header(f, width, height, directions, entries)
+        for entry in entries:
+            f.seek(start + entry['offset'])
+            values = layers[entry['name']]
+            if entry['packed']:
+                values = np.packbits(values.reshape(height, width), axis=1)
+            values.tofile(f)
+        f.truncate(start + size)
+
+
+def read(filename, writable=False):
+    # (header, layers) of a binary map. The layers are memory-mapped, and
+    # copy-on-write unless writable, in which case changes go to the file.
+    # Packed layers are unpacked, which does copy them.
+    with open(filename, 'rb') as f:
+        info, start = _read_header(f)
+    width, height = info['width'], info['height']
+    mode = 'r+' if writable else 'c'
+    layers = {}
+    for entry in info['layers']:
+        values = _map_layer(filename, entry, start, width, height, mode)
+        if entry['packed']:
+            values = np.unpackbits(values, axis=1, count=width).astype(bool).reshape(-1)
+        layers[entry['name']] = values
+    return info, layers
+
+
+def char_tables(cell):
+    # What cell.load does with each (latin-1) character: for every attribute
+    # it sets, an array of its value per character code, and its value in
+    # cells that load is not called for
+    loaded = []
+    for code in range(256):
+        probe = cell()
+        try:
+            probe.load(chr(code))
+        except Exception:
+            loaded.append({})
+            continue
+        loaded.append(dict(probe.__dict__))
+    names = sorted(set(name for attrs in loaded for name in attrs) | set(['wall']))
+    dtypes = getattr(cell, 'layer_dtypes', {})
+    defaults = {}
+    tables = {}
+    for name in names:
+        default = getattr(cell, name, 0)
+        values = [attrs.get(name, default) for attrs in loaded]
+        dtype = dtypes.get(name, np.asarray(values).dtype)
+        defaults[name] = np.asarray(default, dtype=dtype)
+        tables[name] = np.array(values, dtype=dtype)
+    return tables, defaults
+
+
+def _lines(source):
+    # lines of an ASCII map given as a file name, an open file or the map
+    # itself (a string with newlines, which may start with an empty line)
+    if hasattr(source, 'readline'):
+        for line in source:
+            yield line.rstrip()
+    elif '\n' in source:
+        lines = source.splitlines()
+        if lines and len(lines[0]) == 0:
+            del lines[0]
+        for line in lines:
+            yield line.rstrip()
+    else:
+        with open(source, encoding='latin-1') as f:
+            for line in f:
+                yield line.rstrip()
+
+
+def ascii_size(source):
+    width = height = 0
+    for line in _lines(source):
+        width = max(width, len(line))
+        height += 1
+    return width, height
+
+
+def read_ascii_rows(source, cell, width):
+    # (row number, {attribute: values of the row}) for each row of the map
+    tables, defaults = char_tables(cell)
+    for j, line in enumerate(_lines(source)):
+        codes = np.frombuffer(line[:width].encode('latin-1', 'replace'), dtype=np.uint8)
+        row = {}
+        for name, table in tables.items():
+            values = np.full(width, defaults[name], dtype=table.dtype)
+            values[:len(codes)] = table[codes]
+            row[name] = values
+        yield j, row
+
+
+def read_ascii(source, cell):
+    # (width, height, layers) of an ASCII map. A file named by source is
+    # read twice, once to find its size, rather than being held in memory.
+    if hasattr(source, 'readline'):
+        source = '\n' + source.read()
+    width, height = ascii_size(source)
+    layers = {}
+    for j, row in read_ascii_rows(source, cell, width):
+        for name, values in row.items():
+            if name not in layers:
+                layers[name] = np.empty(width * height, dtype=values.dtype)
+            layers[name][j * width:(j + 1) * width] = values
+    return width, height, layers
+
+
+def write_ascii(f, layers, width, height, cell):
+    # Writes layers as an ASCII map, one row at a time. Every combination of
+    # values is written as a character that cell.load turns into it,
+    # printable ones first.
+    tables, defaults = char_tables(cell)
+    names = [name for name in sorted(tables) if name in layers]
+    preferred = list(range(32, 127)) + list(range(32)) + list(range(127, 256))
+    chars = {}
+    for code in reversed(preferred):
+        chars[tuple(tables[name][code].item() for name in names)] = chr(code)
+    for j in range(height):
+        row = [np.asarray(layers[name][j * width:(j + 1) * width]).tolist() for name in names]
+        line = ''.join([chars.get(values, ' ') for values in zip(*row)])
+        f.write(line.rstrip() + '\n')
+
+
+def ascii_to_binary(source, filename, cell, directions=8, pack=True):
+    # Converts an ASCII map to a binary one, row by row, straight into the
+    # memory-mapped output. An open file is read twice too, from where it
+    # is now, if it can seek; otherwise it is read into memory first.
+    if hasattr(source, 'readline') and not source.seekable():
+        source = '\n' + source.read()
+    position = source.tell() if hasattr(source, 'readline') else None
+    width, height = ascii_size(source)
+    if position is not None:
+        source.seek(position)
+    tables, defaults = char_tables(cell)
+    entries, size = _layout(width, height, dict((n, t.dtype) for n, t in tables.items()), pack)
+    with open(filename, 'wb') as f:
+        start = _write_header(f, width, height, directions, entries)
+        f.truncate(start + size)
+    outputs = dict((entry['name'], (entry, _map_layer(filename, entry, start, width, height, 'r+')))
+                   for entry in entries)
+    for j, row in read_ascii_rows(source, cell, width):
+        for name, values in row.items():
+            entry, output = outputs[name]
+            if entry['packed']:
+                output[j] = np.packbits(values)
+            else:
+                output[j * width:(j + 1) * width] = values
+    for entry, output in outputs.values():
+        output.flush()
+
+
+def binary_to_ascii(filename, f, cell):
+    info, layers = read(filename)
+    write_ascii(f, layers, info['width'], info['height'], cell)
+
+
+def load_world(cell, filename, directions=None, writable=False, rule=None):
+    # A compact World on a binary map (memory-mapped, see read) or an ASCII
+    # one
+    with open(filename, 'rb') as f:
+        binary = f.read(len(MAGIC)) == MAGIC
+    if binary:
+        info, layers = read(filename, writable=writable)
+        width, height = info['width'], info['height']
+        if directions is None:
+            directions = info['directions']
+    else:
+        width, height, layers = read_ascii(filename, cell)
+    return grid.World.from_layers(cell, layers, width, height,
+                                  directions=directions or 8, rule=rule)
+
+
+def save_world(world, filename, pack=True):
+    # Saves the cell attributes of a World (compact or not) as a binary map
+    if world.compact:
+        layers = world.layers
+    else:
+        skip = set(grid.CellView.reserved) | set(['agents']) | set(grid.neighbour_synonyms)
+        names = set(['wall'])
+        for c in world.cell_list:
+            names.update(c.__dict__)
+        dtypes = getattr(world.Cell, 'layer_dtypes', {})
+        layers = {}
+        for name in sorted(names - skip):
+            values = world.get_cell_values(name, getattr(world.Cell, name, 0))
+            layers[name] = values.astype(dtypes.get(name, values.dtype))
+    write(filename, layers, world.width, world.height, world.directions, pack)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='convert maps between ASCII and binary')
+    parser.add_argument('source')
+    parser.add_argument('destination')
+    parser.add_argument('--cell', default='colour_critter.Cell',
+                        help='Cell class whose load method reads the map characters')
+    parser.add_argument('--directions', type=int, default=8)
+    parser.add_argument('--to-ascii', action='store_true')
+    args = parser.parse_args()
+
+    module, name = args.cell.rsplit('.', 1)
+    cell = getattr(importlib.import_module(module), name)
+    if args.to_ascii:
+        with open(args.destination, 'w', encoding='latin-1') as f:
+            binary_to_ascii(args.source, f, cell)
+    else:
+        ascii_to_binary(args.source, args.destination, cell, directions=args.directions)
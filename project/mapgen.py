@@ -0,0 +1,188 @@
+# Generates maps of any size from a seed, for testing how things scale with
+# the size of the world. From this directory:
+#
+#   python mapgen.py maze 200 100 --seed 1 --output maze.txt
+#   python mapgen.py rooms 10000 10000 --binary rooms.map
+#
+# A map is made as an array of characters (one byte per cell, in the same
+# format as the ASCII maps: '#' for walls, ' ' for free cells, and R, G, B, M
+# and Y for colours), which to_ascii turns into a map for grid.World(map=...)
+# and make_world into a compact World directly. Everything is done with
+# whole-array operations, so even 10000 x 10000 maps take seconds. The border
+# is always wall, and cell (1, 1) is always free, for the agent to start in.
+import argparse
+import importlib
+
+import numpy as np
+
+import grid
+import mapfile
+
+WALL = ord('#')
+FREE = ord(' ')
+
+
+def maze(width, height, seed=None, loops=0.0):
+    # A maze with passages at odd coordinates, made by the binary tree
+    # algorithm: every passage cell opens to the cell above it or to the
+    # one on its left. All free cells are connected; with loops, that
+    # fraction of the remaining walls between passage cells is knocked
+    # through as well, so that there is more than one way around.
+    rng = np.random.RandomState(seed)
+    rows, columns = (height - 1) // 2, (width - 1) // 2
+    walls = np.ones((height, width), dtype=bool)
+    walls[1:2 * rows:2, 1:2 * columns:2] = False
+    north = rng.randint(0, 2, size=(rows, columns), dtype=bool)
+    north[0, :] = False
+    north[:, 0] = True
+    north[0, 0] = False
+    west = ~north
+    west[0, 0] = False
+    walls[0:2 * rows:2, 1:2 * columns:2][north] = False
+    walls[1:2 * rows:2, 0:2 * columns:2][west] = False
+    if loops > 0:
+        threshold = int(loops * 2 ** 16)
+        between = walls[1:2 * rows:2, 2:2 * columns:2]
+        between[rng.randint(0, 2 ** 16, size=between.shape, dtype=np.uint16) < threshold] = False
+        between = walls[2:2 * rows:2, 1:2 * columns:2]
+        between[rng.randint(0, 2 ** 16, size=between.shape, dtype=np.uint16) < threshold] = False
+    return np.where(walls, WALL, FREE).astype(np.uint8)
+
+
+def rooms(width, height, seed=None, block=16, loops=0.1):
+    # One room of random size in each block x block square, joined to the
+    # rooms next to it by corridors through the middle of the squares. As in
+    # maze, the corridors form a binary tree, plus a fraction (loops) of the
+    # others, so all rooms are connected.
+    if block < 6:
+        raise ValueError('blocks must be at least 6 cells wide')
+    rng = np.random.RandomState(seed)
+    rows, columns = height // block, width // block
+    if rows == 0 or columns == 0:
+        raise ValueError('a %d x %d map does not fit a block of %d' % (width, height, block))
+    c = block // 2
+    # room bounds (inclusive), as offsets in the block; every room covers
+    # the middle of its block, where the corridors run
+    top = rng.randint(1, c, size=(rows, columns))
+    bottom = rng.randint(c + 1, block - 1, size=(rows, columns))
+    left = rng.randint(1, c, size=(rows, columns))
+    right = rng.randint(c + 1, block - 1, size=(rows, columns))
+    top[0, 0] = left[0, 0] = 1
+    # open_right[i, j]: corridor from block (i, j) to (i, j + 1), open_down
+    # from (i, j) to (i + 1, j)
+    north = rng.randint(0, 2, size=(rows, columns), dtype=bool)
+    north[0, :] = False
+    north[:, 0] = True
+    open_right = np.zeros((rows, columns), dtype=bool)
+    open_down = np.zeros((rows, columns), dtype=bool)
+    open_right[:, :-1] = ~north[:, 1:]
+    open_down[:-1, :] = north[1:, :]
+    open_right[:, :-1] |= rng.random_sample((rows, columns - 1)) < loops
+    open_down[:-1, :] |= rng.random_sample((rows - 1, columns)) < loops
+
+    chars = np.full((height, width), WALL, dtype=np.uint8)
+    x = np.arange(columns * block)
+    bx, ox = np.divmod(x, block)
+    oy = np.arange(block)[:, None]
+    # corridor to the left or right of each column's cell in the middle row
+    # of a block, and above or below each row's cell in the middle column
+    side = np.where(ox >= c, bx, bx - 1)
+    for i in range(rows):
+        free = ((top[i][bx] <= oy) & (oy <= bottom[i][bx]) &
+                (left[i][bx] <= ox) & (ox <= right[i][bx]))
+        free[c] |= (side >= 0) & open_right[i][np.maximum(side, 0)]
+        below = open_down[i][bx]
+        above = open_down[i - 1][bx] if i > 0 else np.zeros(len(x), dtype=bool)
+        free[:, ox == c] |= np.where(oy >= c, below, above)[:, ox == c]
+        chars[i * block:(i + 1) * block, :columns * block][free] = FREE
+    return chars
+
+
+def place_colours(chars, colours='RGBMY', count=1, seed=None, min_distance=0, start=(1, 1)):
+    # Puts count cells of each colour on free cells, at least min_distance
+    # apart and away from start. Fewer are placed if there is no room.
+    rng = np.random.RandomState(seed)
+    height, width = chars.shape
+    wanted = len(colours) * count
+    placed = np.empty((0, 2))
+    codes = []
+    tries = 0
+    while len(codes) < wanted and tries < 20:
+        tries += 1
+        candidates = np.unique(rng.randint(0, width * height, size=wanted * 4))
+        candidates = candidates[chars.reshape(-1)[candidates] == FREE]
+        candidates = rng.permutation(candidates)
+        for index in candidates.tolist():
+            y, x = divmod(index, width)
+            if (x, y) == tuple(start):
+                continue
+            if min_distance > 0 and len(placed):
+                if np.min(np.hypot(placed[:, 0] - x, placed[:, 1] - y)) < min_distance:
+                    continue
+            placed = np.vstack([placed, [x, y]])
+            codes.append(index)
+            if len(codes) == wanted:
+                break
+    flat = chars.reshape(-1)
+    for i, index in enumerate(codes):
+        flat[index] = ord(colours[i % len(colours)])
+    return chars
+
+
+def generate(kind, width, height, seed=None, colours='RGBMY', count=1, min_distance=0,
+             **kwargs):
+    # maze or rooms, with colours placed; kwargs are passed on to the layout
+    layout = {'maze': maze, 'rooms': rooms}[kind]
+    chars = layout(width, height, seed=seed, **kwargs)
+    return place_colours(chars, colours, count, seed=seed, min_distance=min_distance)
+
+
+def to_ascii(chars):
+    return '\n'.join(row.tobytes().decode('latin-1') for row in chars)
+
+
+def to_layers(chars, cell):
+    # the cell attributes (see mapfile.char_tables) of every cell
+    tables, defaults = mapfile.char_tables(cell)
+    flat = chars.reshape(-1)
+    return dict((name, table[flat]) for name, table in tables.items())
+
+
+def make_world(cell, chars, directions=4, rule=None):
+    height, width = chars.shape
+    return grid.World.from_layers(cell, to_layers(chars, cell), width, height,
+                                  directions=directions, rule=rule)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('kind', choices=['maze', 'rooms'])
+    parser.add_argument('width', type=int)
+    parser.add_argument('height', type=int)
+    parser.add_argument('--seed', type=int, default=None)
+    parser.add_argument('--colours', default='RGBMY')
+    parser.add_argument('--count', type=int, default=1, help='cells of each colour')
+    parser.add_argument('--min-distance', type=float, default=0)
+    parser.add_argument('--loops', type=float, default=None)
+    parser.add_argument('--output', help='ASCII map to write (default: stdout)')
+    parser.add_argument('--binary', help='binary map to write (see mapfile.py)')
+    parser.add_argument('--cell', default='colour_critter.Cell',
+                        help='Cell class whose load method reads the map characters')
+    parser.add_argument('--directions', type=int, default=4)
+    args = parser.parse_args()
+
+    kwargs = {}
+    if args.loops is not None:
+        kwargs['loops'] = args.loops
+    chars = generate(args.kind, args.width, args.height, seed=args.seed, colours=args.colours,
+                     count=args.count, min_distance=args.min_distance, **kwargs)
+    if args.binary:
+        module, name = args.cell.rsplit('.', 1)
+        cell = getattr(importlib.import_module(module), name)
+        mapfile.write(args.binary, to_layers(chars, cell), args.width, args.height,
+                      args.directions)
+    elif args.output:
+        with open(args.output, 'w', encoding='latin-1') as f:
+            f.write(to_ascii(chars) + '\n')
+    else:
+        print(to_ascii(chars))
@@ -0,0 +1,129 @@
+# On-disk cache for building the colour critter (or any nengo network).
+#
+# Most of the build time goes into solving for decoders. The built model
+# itself cannot be stored, because its Nodes call back into the Python world
+# and agent. So each network gets its own nengo DecoderCache directory, keyed
+# by a hash of the network's structure, parameters and seed. Later builds of
+# the same network, including builds in other processes, load the decoders
+# from there instead of solving for them again. Directories that have not
+# been used for the longest time are removed once the cache grows past its
+# size limit.
+import argparse
+import hashlib
+import os
+import shutil
+
+import numpy as np
+import nengo
+from nengo.builder import Model
+from nengo.cache import DecoderCache
+from nengo.utils.cache import human2bytes
+
+default_dir = os.path.join(os.path.expanduser('~'), '.cache', 'colour_critter')
+
+
+def network_hash(network, **params):
+    # Anything that changes what the build solves for changes the hash:
+    # ensembles, connections (including their function's code), seeds, and
+    # any extra keyword parameters
+    h = hashlib.sha1()
+
+    def add(*items):
+        for item in items:
+            if isinstance(item, np.ndarray):
+                h.update(item.tobytes())
+            else:
+                h.update(repr(item).encode())
+
+    add(network.seed, sorted(params.items()))
+    for ens in network.all_ensembles:
+        add('ensemble', ens.n_neurons, ens.dimensions, ens.radius, ens.neuron_type,
+            ens.seed, ens.intercepts, ens.max_rates, ens.encoders)
+    for node in network.all_nodes:
+        add('node', node.size_in, node.size_out)
+    for conn in network.all_connections:
+        function = conn.function
+        if hasattr(function, '__code__'):
+            code = function.__code__
+            function = (code.co_code, code.co_names,
+                        [c for c in code.co_consts if not hasattr(c, 'co_code')])
+        add('connection', conn.size_in, conn.size_mid, conn.size_out, conn.synapse,
+            conn.solver, conn.seed, np.asarray(conn.transform), function,
+            conn.eval_points)
+    return h.hexdigest()
+
+
+class ModelCache(object):
+    def __init__(self, cache_dir=default_dir, size_limit='1 GB'):
+        if not isinstance(size_limit, int):
+            size_limit = human2bytes(size_limit)
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+        if not os.path.isdir(cache_dir):
+            os.makedirs(cache_dir)
+
+    def path(self, key):
+        return os.path.join(self.cache_dir, key)
+
+    def simulator(self, network, dt=0.001, key=None, **kwargs):
+        # A nengo.Simulator for the network, built with the decoders cached
+        # under key (by default the network_hash of the network)
+        if key is None:
+            key = network_hash(network, dt=dt)
+        path = self.path(key)
+        model = Model(dt=dt, label='%s, dt=%f' % (network, dt),
+                      decoder_cache=DecoderCache(cache_dir=path))
+        sim = nengo.Simulator(network, dt=dt, model=model, **kwargs)
+        os.utime(path, None)  # marks the entry as recently used
+        self.shrink()
+        return sim
+
+    def entries(self):
+        # (last used, size in bytes, key) of every network in the cache
+        entries = []
+        for key in os.listdir(self.cache_dir):
+            path = self.path(key)
+            if not os.path.isdir(path):
+                continue
+            size = 0
+            for root, dirs, files in os.walk(path):
+                size += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+            entries.append((os.path.getmtime(path), size, key))
+        return entries
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def shrink(self, limit=None):
+        # Removes the least recently used networks until the cache fits
+        if limit is None:
+            limit = self.size_limit
+        entries = sorted(self.entries())
+        excess = sum(size for _, size, _ in entries) - limit
+        for _, size, key in entries:
+            if excess <= 0:
+                break
+            self.invalidate(key)
+            excess -= size
+
+    def invalidate(self, key=None):
+        # Removes the cached decoders of one network, or of all of them
+        keys = [key] if key is not None else [k for _, _, k in self.entries()]
+        for k in keys:
+            shutil.rmtree(self.path(k), ignore_errors=True)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--cache-dir', default=default_dir)
+    parser.add_argument('--shrink', help='shrink the cache to this size (e.g. "200 MB")')
+    parser.add_argument('--invalidate', action='store_true', help='empty the cache')
+    args = parser.parse_args()
+
+    cache = ModelCache(args.cache_dir)
+    if args.invalidate:
+        cache.invalidate()
+    elif args.shrink:
+        cache.shrink(human2bytes(args.shrink))
+    for last_used, size, key in sorted(cache.entries()):
+        print('%s %10d' % (key, size))
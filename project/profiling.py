@@ -0,0 +1,134 @@
+# Timing of the Python callbacks of a nengo model (Node functions and the
+# GridNode's drawing), to see how much of a run they take compared to the
+# neural simulation. Nothing is timed unless it is wrapped, so a model that
+# is not instrumented runs exactly as before:
+#
+#   profiler = profiling.Profiler()
+#   profiling.instrument(model, profiler)
+#   with nengo.Simulator(model) as sim:
+#       sim.run(10)
+#   print(profiler.report(total=...))
+#
+# Every callback gets a call count, total time and a histogram of its
+# latencies, with power-of-two bins in nanoseconds (bin i counts the calls
+# that took less than 2**i ns, and at least 2**(i-1)). summary() can be
+# called at any time, including while the simulation is running.
+import time
+
+import nengo
+
+import grid
+
+bins = 40
+
+
+class Profiler(object):
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.calls = {}
+        self.times = {}  # total ns
+        self.histograms = {}
+
+    def wrap(self, name, function):
+        # function, timed under name. A disabled profiler returns function
+        # itself.
+        if not self.enabled:
+            return function
+        self.calls.setdefault(name, 0)
+        self.times.setdefault(name, 0)
+        histogram = self.histograms.setdefault(name, [0] * bins)
+        calls, times = self.calls, self.times
+        clock = time.perf_counter_ns
+
+        def timed(*args, **kwargs):
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                elapsed = clock() - start
+                calls[name] += 1
+                times[name] += elapsed
+                histogram[min(elapsed.bit_length(), bins - 1)] += 1
+        timed.__name__ = getattr(function, '__name__', name)
+        timed.__wrapped__ = function
+        return timed
+
+    def percentile(self, name, q):
+        # upper edge (in seconds) of the histogram bin holding the q-th
+        # percentile of name's latencies
+        histogram = self.histograms[name]
+        total = sum(histogram)
+        if total == 0:
+            return 0.0
+        seen = 0
+        for i, count in enumerate(histogram):
+            seen += count
+            if seen >= total * q / 100.0:
+                return 2 ** i * 1e-9
+        return 2 ** (bins - 1) * 1e-9
+
+    def summary(self):
+        # {name: {'calls', 'total', 'mean', 'p50', 'p99', 'histogram'}}, in
+        # seconds
+        summary = {}
+        for name in list(self.calls):
+            calls = self.calls[name]
+            total = self.times[name] * 1e-9
+            summary[name] = {
+                'calls': calls,
+                'total': total,
+                'mean': total / calls if calls else 0.0,
+                'p50': self.percentile(name, 50),
+                'p99': self.percentile(name, 99),
+                'histogram': list(self.histograms[name]),
+            }
+        return summary
+
+    def report(self, total=None):
+        # A table of the summary, slowest first. With the total wall time of
+        # the run, also the share of it each callback took.
+        lines = ['%-30s %8s %10s %10s %10s %10s%s' % (
+            'callback', 'calls', 'total s', 'mean us', 'p50 us', 'p99 us',
+            '  of run' if total else '')]
+        summary = self.summary()
+        for name in sorted(summary, key=lambda n: -summary[n]['total']):
+            s = summary[name]
+            share = '  %5.1f%%' % (100.0 * s['total'] / total) if total else ''
+            lines.append('%-30s %8d %10.3f %10.1f %10.1f %10.1f%s' % (
+                name, s['calls'], s['total'], s['mean'] * 1e6, s['p50'] * 1e6,
+                s['p99'] * 1e6, share))
+        return '\n'.join(lines)
+
+    def reset(self):
+        for name in self.calls:
+            self.calls[name] = 0
+            self.times[name] = 0
+            self.histograms[name][:] = [0] * bins
+
+
+def instrument(network, profiler, names=None):
+    # Wraps the function of every Node in network (and its subnetworks)
+    # with profiler. Nodes are named by names ({node: name}), their label,
+    # or their function's name. GridNodes have their drawing methods wrapped
+    # instead, as nengo_gui reads the HTML off their function.
+    if not profiler.enabled:
+        return
+    names = names or {}
+    for node in network.all_nodes:
+        name = names.get(node) or node.label
+        if isinstance(node, grid.GridNode):
+            name = name or 'GridNode'
+            if hasattr(node.generate_svg, '__wrapped__'):
+                continue
+            for method in ('generate_svg', 'generate_cell_svg', 'generate_agent_svg'):
+                setattr(node, method, profiler.wrap('%s.%s' % (name, method),
+                                                    getattr(node, method)))
+        elif callable(node.output) and not isinstance(node.output, nengo.Process):
+            if hasattr(node.output, '_nengo_html_') or hasattr(node.output, '__wrapped__'):
+                continue
+            name = name or getattr(node.output, '__name__', 'node')
+            unique, i = name, 1
+            while unique in profiler.calls:
+                i += 1
+                unique = '%s#%d' % (name, i)
+            node.output = profiler.wrap(unique, node.output)
@@ -0,0 +1,208 @@
+# Parameter sweeps over the hand-picked constants of the models: the basal
+# ganglia weights and thresholds of the colour critter (see
+# colour_critter.default_weights) and the change and letter costs of the
+# change detector. From this directory:
+#
+#   python sweep.py critter --grid mem_w=1,2,3 memory_threshold=0.6,0.8 --seeds 4
+#   python sweep.py change --random 20 change_cost=0.5:1 letter_cost=0.1:0.4 --seeds 8
+#
+# A sweep runs a list of points (dicts of parameter values), laid out as a
+# grid or drawn at random, on a number of seeds across a pool of processes.
+# Every run is appended to a cache (a JSON lines file) under a key made from
+# the target, its options, the point and the seed, so runs that are in there
+# already, from an earlier or interrupted sweep, are never done again.
+#
+# The seeds are run a round at a time. After each round the points that did
+# worst so far (the fraction `prune` of those still going) are dropped, so
+# hopeless configurations stop early and the seeds go to the good ones.
+import argparse
+import concurrent.futures
+import hashlib
+import itertools
+import json
+import math
+import os
+import sys
+
+import numpy as np
+
+# change_batch (the change detector) is in the directory above; it goes at the
+# end of the path, once, so nothing there can shadow the modules here
+top = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if top not in sys.path:
+    sys.path.append(top)
+import change_batch
+
+
+def critter(params, seed, sim_time=10.0, dt=0.001, fidelity=None):
+    # One episode of the colour critter with params as its weights. The
+    # score is the number of colours the agent walked onto for the first
+    # time, less the number of times it walked back onto one
+    import episodes
+    result = episodes.run_episode(seed, sim_time=sim_time, dt=dt, fidelity=fidelity,
+                                  weights=params)
+    seen = set()
+    score = 0
+    for name in result['visited'].split():
+        score += -1 if name in seen else 1
+        seen.add(name)
+    return {'score': score, 'visited': result['visited'],
+            'collisions': int(result['collisions']), 'run_time': result['run_time']}
+
+
+def change(params, seed, duration=5.0, dt=0.001, changes=10, model_seed=0):
+    # The change detector with params (change_cost, letter_cost, ...) passed
+    # to make_model, on the random signal of seed. The score is the F1 of
+    # its changes against change_batch.ReferenceDetector. make_model seeds
+    # everything from model_seed, so a run_key always gives the same result.
+    detector = change_batch.NeuralDetector(dt=dt, seed=model_seed, **params)
+    signal = change_batch.random_signal(duration, dt, changes, seed=seed)
+    events, letters = change_batch.run(detector, signal)
+    reference, _ = change_batch.run(change_batch.ReferenceDetector(dt=dt), signal)
+    detector.close()
+    result = change_batch.score(events, reference)
+    return {'score': result['f1'], 'precision': result['precision'],
+            'recall': result['recall'],
+            'letters_in_order': change_batch.letters_in_order(letters,
+                                                              detector.model.transitions)}
+
+
+targets = {'critter': critter, 'change': change}
+
+
+def grid_points(space):
+    # every combination of the values in space ({name: [values]})
+    names = list(space)
+    return [dict(zip(names, values)) for values in itertools.product(*[space[n] for n in names])]
+
+
+def random_points(space, n, seed=None):
+    # n points with each parameter drawn uniformly from space[name], a
+    # (low, high) range, or from a list of values
+    rng = np.random.RandomState(seed)
+    points = [{} for i in range(n)]
+    for name, values in space.items():
+        if isinstance(values, tuple):
+            drawn = rng.uniform(values[0], values[1], size=n).round(4).tolist()
+        else:
+            drawn = [values[i] for i in rng.randint(len(values), size=n)]
+        for point, value in zip(points, drawn):
+            point[name] = value
+    return points
+
+
+def run_key(target, options, params, seed):
+    text = json.dumps([target, options, params, seed], sort_keys=True)
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()
+
+
+class Cache(object):
+    # Results by run_key, read from and appended to a JSON lines file
+    def __init__(self, filename):
+        self.filename = filename
+        self.results = {}
+        if filename is not None and os.path.exists(filename):
+            with open(filename) as f:
+                for line in f:
+                    if line.strip():
+                        record = json.loads(line)
+                        self.results[record['key']] = record['result']
+
+    def __contains__(self, key):
+        return key in self.results
+
+    def get(self, key):
+        return self.results[key]
+
+    def add(self, key, record):
+        self.results[key] = record['result']
+        if self.filename is not None:
+            with open(self.filename, 'a') as f:
+                f.write(json.dumps(dict(record, key=key), sort_keys=True) + '\n')
+
+
+def _run(target, params, seed, options):
+    return targets[target](params, seed, **options)
+
+
+def sweep(target, points, seeds, cache='sweep.jsonl', seeds_per_round=2, prune=0.5,
+          processes=None, **options):
+    # Runs every point on the seeds (see above), returning one summary per
+    # point, best first: its parameters, mean score, the scores and whether
+    # it was stopped early. options are passed on to the target.
+    cache = cache if isinstance(cache, Cache) else Cache(cache)
+    seeds = list(seeds)
+    scores = [[] for point in points]
+    going = list(range(len(points)))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        for start in range(0, len(seeds), seeds_per_round):
+            runs = [(i, seed) for i in going for seed in seeds[start:start + seeds_per_round]]
+            futures = {}
+            for i, seed in runs:
+                key = run_key(target, options, points[i], seed)
+                if key not in cache:
+                    futures[pool.submit(_run, target, points[i], seed, options)] = (i, seed, key)
+            for future in concurrent.futures.as_completed(futures):
+                i, seed, key = futures[future]
+                cache.add(key, {'target': target, 'options': options, 'params': points[i],
+                                'seed': seed, 'result': future.result()})
+            for i, seed in runs:
+                scores[i].append(cache.get(run_key(target, options, points[i], seed))['score'])
+
+            if start + seeds_per_round < len(seeds) and prune:
+                keep = max(1, int(math.ceil(len(going) * (1 - prune))))
+                going = sorted(going, key=lambda i: -np.mean(scores[i]))[:keep]
+
+    summary = [{'params': points[i], 'score': float(np.mean(scores[i])),
+                'scores': scores[i], 'stopped': i not in going} for i in range(len(points))]
+    return sorted(summary, key=lambda s: (s['stopped'], -s['score']))
+
+
+def parse_space(specs, ranges=False):
+    # name=v1,v2,... (or name=low:high for ranges) into a space
+    space = {}
+    for spec in specs:
+        name, values = spec.split('=', 1)
+        if ranges and ':' in values:
+            low, high = values.split(':')
+            space[name] = (float(low), float(high))
+        else:
+            space[name] = [json.loads(v) for v in values.split(',')]
+    return space
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('target', choices=sorted(targets))
+    parser.add_argument('--grid', nargs='+', metavar='NAME=VALUES',
+                        help='grid over the comma separated values of each parameter')
+    parser.add_argument('--random', nargs='+', metavar='N NAME=LOW:HIGH',
+                        help='N random points, from ranges or comma separated values')
+    parser.add_argument('--point-seed', type=int, default=0,
+                        help='seed of the random points (the same points are cached)')
+    parser.add_argument('--seeds', type=int, default=4)
+    parser.add_argument('--seeds-per-round', type=int, default=2)
+    parser.add_argument('--prune', type=float, default=0.5,
+                        help='fraction of the points dropped after each round')
+    parser.add_argument('--cache', default='sweep.jsonl')
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--option', nargs='+', default=[], metavar='NAME=VALUE',
+                        help='passed to the target, e.g. sim_time=30')
+    args = parser.parse_args()
+
+    if args.grid:
+        points = grid_points(parse_space(args.grid))
+    elif args.random:
+        points = random_points(parse_space(args.random[1:], ranges=True), int(args.random[0]),
+                               seed=args.point_seed)
+    else:
+        parser.error('give --grid or --random')
+    options = dict((name, json.loads(value))
+                   for name, value in (o.split('=', 1) for o in args.option))
+
+    summary = sweep(args.target, points, range(args.seeds), cache=args.cache,
+                    seeds_per_round=args.seeds_per_round, prune=args.prune,
+                    processes=args.processes, **options)
+    for s in summary:
+        print('%8.3f  %-8s %s' % (s['score'], 'stopped' if s['stopped'] else '',
+                                  json.dumps(s['params'], sort_keys=True)))
@@ -0,0 +1,90 @@
+# Records what an agent does at every time step, cheaply enough to leave on
+# during long runs. Values go into preallocated arrays (one per field, with
+# room for `capacity` samples). With a directory, every full buffer is
+# written there as the next numbered .npz chunk; without one, the buffers are
+# rings holding the latest `capacity` samples. With decimate=n only every
+# n-th call to record is kept. Fields are stored as `dtype` unless they give
+# their own: time and position are float64, as float32 can no longer tell
+# apart times one dt (1 ms) apart after a few hours of simulated time.
+#
+#   recorder = telemetry.Recorder(telemetry.agent_fields, directory='run1')
+#   model = colour_critter.make_model(recorder=recorder)
+#   ...
+#   recorder.close()
+#   data = telemetry.load('run1')   # {'t': ..., 'x': ..., ...}
+import glob
+import os
+
+import numpy as np
+
+# what colour_critter records: time, position, heading, colour of the
+# current cell, the sensors node's output and the motor command
+agent_fields = (('t', 1, np.float64), ('x', 1, np.float64), ('y', 1, np.float64),
+                ('dir', 1), ('cellcolor', 1), ('sensors', 9), ('motor', 2))
+
+
+class Recorder(object):
+    def __init__(self, fields=agent_fields, capacity=10000, directory=None, decimate=1,
+                 dtype=np.float32):
+        # fields are (name, size) or (name, size, dtype)
+        fields = [tuple(field) + (dtype,) * (3 - len(field)) for field in fields]
+        self.names = [name for name, size, field_dtype in fields]
+        self.buffers = [np.zeros((capacity, size) if size > 1 else capacity, dtype=field_dtype)
+                        for name, size, field_dtype in fields]
+        self.capacity = capacity
+        self.directory = directory
+        self.decimate = decimate
+        self.calls = 0
+        self.position = 0  # where the next sample goes
+        self.count = 0  # samples in the buffers
+        self.recorded = 0
+        self.chunks = 0
+        if directory is not None:
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            # new chunks go after any that are there already
+            self.chunks = len(glob.glob(os.path.join(directory, 'chunk-*.npz')))
+
+    def record(self, *values):
+        # one value (or sequence of values) per field, in order
+        self.calls += 1
+        if self.calls % self.decimate:
+            return
+        i = self.position
+        for buffer, value in zip(self.buffers, values):
+            buffer[i] = value
+        self.position = (i + 1) % self.capacity
+        self.recorded += 1
+        self.count = min(self.count + 1, self.capacity)
+        if self.directory is not None and self.count == self.capacity:
+            self.flush()
+
+    def flush(self):
+        # Writes the samples in the buffers as the next chunk
+        if self.directory is None or self.count == 0:
+            return
+        filename = os.path.join(self.directory, 'chunk-%06d.npz' % self.chunks)
+        np.savez(filename, **dict((name, buffer[:self.count])
+                                  for name, buffer in zip(self.names, self.buffers)))
+        self.chunks += 1
+        self.count = 0
+        self.position = 0
+
+    def close(self):
+        self.flush()
+
+    def data(self):
+        # the samples in the buffers (oldest first), as {field: array}
+        start = self.position if self.count == self.capacity else 0
+        order = (np.arange(self.count) + start) % self.capacity
+        return dict((name, buffer[order]) for name, buffer in zip(self.names, self.buffers))
+
+
+def load(directory):
+    # all chunks written to directory, joined, as {field: array}
+    chunks = [np.load(filename) for filename in sorted(glob.glob(
+        os.path.join(directory, 'chunk-*.npz')))]
+    if not chunks:
+        return {}
+    return dict((name, np.concatenate([chunk[name] for chunk in chunks]))
+                for name in chunks[0].files)
@@ -0,0 +1,21 @@
+import benchmark
+
+
+def test_suite_runs():
+    # every benchmark, on the smallest map and without the nengo model
+    records = benchmark.run([10], model=False)
+    names = set(r['name'] for r in records)
+    assert 'GridNode.generate_svg (full)' in names
+    assert 'World.find_path (A*)' in names
+    assert 'mapfile.load_world (binary)' in names
+    assert all(r['seconds'] > 0 for r in records)
+
+
+def test_compare():
+    baseline = [{'name': 'a', 'size': 10, 'seconds': 1.0},
+                {'name': 'b', 'size': 10, 'seconds': 1.0}]
+    records = [{'name': 'a', 'size': 10, 'seconds': 1.1},
+               {'name': 'b', 'size': 10, 'seconds': 2.0},
+               {'name': 'c', 'size': 10, 'seconds': 5.0}]
+    slower = benchmark.compare(records, baseline, tolerance=0.25)
+    assert [(r['name'], before) for r, before in slower] == [('b', 1.0)]
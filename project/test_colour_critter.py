@@ -0,0 +1,45 @@
+import nengo
+import numpy as np
+
+import colour_critter
+import telemetry
+
+
+def drive(model, speed, steps, t=0.0, dt=0.001):
+    for i in range(steps):
+        t += dt
+        model.movement.output(t, np.array([speed, 0.0]))
+    return t
+
+
+def test_collisions_count_bumps_not_blocked_steps():
+    model = colour_critter.make_model(seed=0, fidelity='direct')
+    body = model.body
+    t = drive(model, 1.0, 2000)  # into the wall ahead, and keep pushing
+    assert body.blocked
+    assert body.collisions == 1
+    t = drive(model, -1.0, 50, t)
+    t = drive(model, 1.0, 500, t)
+    assert body.collisions == 2
+
+
+def test_recorder():
+    recorder = telemetry.Recorder(capacity=100)
+    model = colour_critter.make_model(seed=0, fidelity='direct', recorder=recorder)
+    assert recorder.count == 0  # nothing from building the model
+    with nengo.Simulator(model, progress_bar=False) as sim:
+        sim.run_steps(5)
+    data = recorder.data()
+    assert np.allclose(data['t'], sim.dt * np.arange(1, 6))
+    assert data['sensors'].shape == (5, 9)
+    assert np.all(data['sensors'][:, :3] > 0)
+
+
+def test_held_sensors_resample_after_a_reset():
+    model = colour_critter.make_model(seed=0, fidelity='direct', sample_period=0.5)
+    sense = model.sensors.output
+    first = sense(0.9)[:3]
+    model.body.turn(1)  # the walls look different now, but that is only
+    assert np.allclose(sense(1.0)[:3], first)  # read at the next sample
+    # after a reset (t from 0 again) the sensors are read straight away
+    assert not np.allclose(sense(0.001)[:3], first)
@@ -0,0 +1,29 @@
+import numpy as np
+
+import colour_env
+
+
+def test_collision_penalty_is_per_bump():
+    env = colour_env.ColourEnv(n=1, collision_penalty=1.0, new_colour_reward=0.0,
+                               revisit_penalty=0.0, start=(1, 1, 0))
+    env.reset(seed=0)
+    rewards = [env.step([[1.0, 0.0]])[1][0] for i in range(500)]
+    assert rewards.count(-1.0) == 1
+
+
+# only red (2) and blue (3), side by side in a corridor
+red_and_blue = """
+#####
+#RB #
+#####
+"""
+
+
+def test_episode_ends_when_the_colours_in_the_map_are_reached():
+    env = colour_env.ColourEnv(n=1, world_map=red_and_blue, start=(1, 1, 1))
+    env.reset(seed=0)
+    for i in range(200):
+        observations, reward, done, info = env.step([[1.0, 0.0]])
+        if done[0]:
+            break
+    assert done[0] and info['steps'][0] < 200
@@ -0,0 +1,121 @@
+import grid
+
+
+class LifeCell(grid.Cell):
+    alive = False
+
+    def update(self):
+        n = sum(c.alive for c in self.neighbours)
+        self.alive = n == 3 or (self.alive and n == 2)
+
+
+class MapCell(grid.Cell):
+    def load(self, char):
+        self.wall = char == '#'
+
+
+def alive(world):
+    return sorted((c.x, c.y) for c in world.cells() if c.alive)
+
+
+def test_cell_update_is_synchronous():
+    # a blinker only flips if every cell sees its neighbours' old state
+    world = grid.World(LifeCell, width=5, height=5, directions=8)
+    for x in (1, 2, 3):
+        world.get_cell(x, 2).alive = True
+    world.update()
+    assert alive(world) == [(2, 1), (2, 2), (2, 3)]
+    world.update()
+    assert alive(world) == [(1, 2), (2, 2), (3, 2)]
+
+
+def test_version_changes():
+    world = grid.World(LifeCell, width=5, height=5, directions=8)
+    version = world.version
+    world.get_cell(1, 1).alive = True
+    assert world.version > version
+    version = world.version
+    world.reset()
+    assert world.version > version
+
+    # no cells are made again on a compact world, so reset has to say so
+    world = grid.World(width=5, height=5, compact=True)
+    version = world.version
+    world.reset()
+    assert world.version > version
+
+
+wall_map = """
+#####
+#   #
+#   #
+#####
+"""
+
+
+def test_wall_targets_cannot_be_reached():
+    world = grid.World(MapCell, width=5, height=4, directions=4, map=wall_map)
+    agent = grid.Agent()
+    world.add(agent, x=1, y=2)
+    wall = world.get_cell(0, 2)
+    assert world.find_path(agent.cell, wall) is None
+    assert agent.go_towards(wall) is False
+    assert (agent.cell.x, agent.cell.y) == (1, 2)
+    # also when the distance field is cached
+    assert world.find_path(agent.cell, wall) is None
+
+
+def test_go_towards():
+    world = grid.World(MapCell, width=5, height=4, directions=4, map=wall_map)
+    agent = grid.Agent()
+    world.add(agent, x=1, y=1)
+    target = world.get_cell(3, 2)
+    path = world.find_path(agent.cell, target)
+    assert len(path) == 4 and not any(c.wall for c in path)
+    for i in range(3):
+        assert agent.go_towards(target) is True
+    assert agent.cell is target
+    assert agent.go_towards(target) is None
+
+
+def test_compact_layers_widen_to_hold_new_values():
+    world = grid.World(width=3, height=3, compact=True)
+    a = world.get_cell(0, 0)
+    b = world.get_cell(1, 0)
+    a.score = 0
+    b.score = 0.75
+    assert (a.score, b.score) == (0, 0.75)
+    a.name = 'a'
+    b.name = 'hello'
+    assert (a.name, b.name) == ('a', 'hello')
+    # values that fit leave the layer as it is
+    a.wall = 1
+    assert world.get_layer('wall').dtype == bool
+
+
+def test_batch_collisions_count_bumps_not_blocked_steps():
+    world = grid.World(MapCell, width=5, height=4, directions=4, map=wall_map)
+    batch = grid.AgentBatch()
+    world.add_batch(batch, x=[1, 3], y=[1, 2], dir=[0, 1])
+    for i in range(20):  # into a wall, and keep pushing
+        batch.go_forward(0.3)
+    assert batch.blocked.all()
+    assert batch.collisions.tolist() == [1, 1]
+    batch.go_backward(0.3)
+    for i in range(5):
+        batch.go_forward(0.3)
+    assert batch.collisions.tolist() == [2, 2]
+
+
+def test_agents_still_move_after_a_reset():
+    world = grid.World(MapCell, width=5, height=4, directions=4, map=wall_map)
+    world.bucket_size = 1  # so every move changes bucket
+    world.reset()
+    agent = grid.Agent()
+    world.add(agent, x=1, y=1)
+    world.reset()
+    cell = agent.cell
+    for dir in range(4):
+        agent.dir = dir
+        agent.go_forward()
+    assert agent.cell is not cell
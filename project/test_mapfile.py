@@ -0,0 +1,27 @@
+import io
+
+import numpy as np
+
+import grid
+import mapfile
+
+
+class MapCell(grid.Cell):
+    def load(self, char):
+        self.wall = char == '#'
+
+
+room = """
+#####
+#   #
+# # #
+#####
+"""
+
+
+def test_ascii_to_binary_from_an_open_file(tmpdir):
+    filename = str(tmpdir.join('room.map'))
+    mapfile.ascii_to_binary(io.StringIO(room.lstrip('\n')), filename, MapCell)
+    info, layers = mapfile.read(filename)
+    assert (info['width'], info['height']) == (5, 4)
+    assert np.count_nonzero(layers['wall']) == room.count('#')
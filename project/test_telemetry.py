@@ -0,0 +1,14 @@
+import numpy as np
+
+import telemetry
+
+
+def test_long_run_times_stay_apart():
+    # 5 hours in, float32 can no longer tell steps of 1 ms apart
+    recorder = telemetry.Recorder(capacity=10)
+    t = 5 * 3600 + 0.001 * np.arange(10)
+    for i in range(10):
+        recorder.record(t[i], 0, 0, 0, 0, np.zeros(9), np.zeros(2))
+    data = recorder.data()
+    assert np.all(np.diff(data['t']) > 0)
+    assert data['sensors'].dtype == np.float32